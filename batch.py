@@ -0,0 +1,124 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import CACHE_DIR, load_wenu
+from selection import REGION, SPEC, compile_selection, count, cut_bits, load_spec, pattern_counts
+from xsection import ACCEPTANCE, BG_FACTOR, EFF, LUMI, SIGMA_ERR, cross_section
+
+# batch analysis of several samples: a samples file (json/yaml) gives every sample its source, selection
+# spec and working point, efficiencies, acceptance, luminosity and background factors (the values of
+# xsection.py when missing). The samples of one source are analysed together in one worker: the
+# events are loaded (memory-mapped) once and the cuts of every distinct selection are evaluated once,
+# the samples only differ in the numbers going into the cross section.
+#
+#   samples:
+#     Wenu: {source: Wenu.csv}
+#     Wenu-tight: {source: Wenu.csv, selection: tight.yaml, working_point: tight, lumi: 35500}
+#     control: {source: control.csv, eff: {EB: 0.75, EE: 0.6}, acceptance: 0.45}
+#
+# Every source needs the columns of Wenu.csv. Relative paths are relative to the samples file. eff and
+# factor may give only some of the regions.
+DEFAULTS = {"selection": None, "working_point": None, "eff": EFF, "acceptance": ACCEPTANCE, "lumi": LUMI,
+            "factor": BG_FACTOR, "sigma_err": SIGMA_ERR}
+
+
+def load_samples(path):
+    """{name: sample} of a samples file, with the defaults filled in and the selection specs read."""
+    samples = load_spec(path)["samples"]
+    base = os.path.dirname(path)
+    out = {}
+    for name, sample in samples.items():
+        unknown = set(sample) - set(DEFAULTS) - {"source"}
+        if unknown or "source" not in sample:
+            raise ValueError("sample {}: {}".format(name, "unknown keys " + ", ".join(sorted(unknown))
+                                                    if unknown else "no source"))
+        for key in ("eff", "factor"):
+            # per region values, the regions not given keep the defaults
+            values = sample.get(key, {})
+            if not isinstance(values, dict) or not set(values) <= set(REGION):
+                raise ValueError("sample {}: {} must map regions ({}) to numbers".format(
+                    name, key, ", ".join(REGION)))
+            sample = dict(sample, **{key: dict(DEFAULTS[key], **values)})
+        sample = dict(DEFAULTS, **sample)
+        if "://" not in sample["source"]:
+            sample["source"] = os.path.join(base, sample["source"])
+        selection = sample["selection"]
+        if isinstance(selection, str):
+            selection = load_spec(os.path.join(base, selection))
+        sample["spec"] = selection or SPEC
+        out[name] = sample
+    return out
+
+
+def _selection_key(sample):
+    return json.dumps([sample["spec"], sample["working_point"]], sort_keys=True)
+
+
+def analyse_source(source, samples, cache_dir=CACHE_DIR, offline=None):
+    """Results of the samples {name: sample} which all read source."""
+    df = load_wenu(source, cache_dir, offline=offline)
+    patterns = {}
+    out = {}
+    for name, sample in samples.items():
+        key = _selection_key(sample)
+        if key not in patterns:
+            selection = compile_selection(sample["spec"], sample["working_point"])
+            patterns[key] = pattern_counts(cut_bits(df, selection))
+        n = {}
+        for region in REGION:
+            n[region] = count(patterns[key], region)
+            n[region + "cut"] = count(patterns[key], region, "all")
+            n[region + "scut"] = count(patterns[key], region, "all", signal=True)
+            n[region + "sbg"] = count(patterns[key], region, background=True, signal=True)
+        result = cross_section({r: n[r + "scut"] for r in REGION}, {r: n[r + "sbg"] for r in REGION},
+                               sample["factor"], sample["eff"], sample["acceptance"], sample["lumi"])
+        result["sigmaerr"] = sample["sigma_err"]/sample["lumi"]
+        result["source"] = source
+        result["events"] = len(df)
+        result["counts"] = n
+        result["lumi"] = sample["lumi"]
+        for region in REGION:
+            result["acceptance " + region] = n[region + "cut"]/n[region] if n[region] else float("nan")
+        out[name] = result
+    return out
+
+
+def run_batch(samples, cache_dir=CACHE_DIR, workers=None, offline=None):
+    """Analyses the samples, one worker process per source, returns {name: result} in the input order."""
+    sources = {}
+    for name, sample in samples.items():
+        sources.setdefault(sample["source"], {})[name] = sample
+    with ProcessPoolExecutor(min(workers or os.cpu_count(), len(sources))) as pool:
+        results = pool.map(analyse_source, list(sources), list(sources.values()),
+                           [cache_dir]*len(sources), [offline]*len(sources))
+        out = {}
+        for result in results:
+            out.update(result)
+    return {name: out[name] for name in samples}
+
+
+COLUMNS = ["sample", "events", "acceptance EB", "acceptance EE", "N EB", "N EE", "eps_av", "lumi", "sigma",
+           "sigmaerr"]
+
+
+def _row(name, r):
+    return [name, r["events"], r["acceptance EB"], r["acceptance EE"], r["N"]["EB"], r["N"]["EE"], r["eps_av"],
+            r["lumi"], r["sigma"], r["sigmaerr"]]
+
+
+def print_batch(results):
+    print("{:<20}{:>9}{:>9}{:>9}{:>8}{:>8}{:>8}{:>10}{:>10}{:>9}".format(
+        "sample", "events", "acc EB", "acc EE", "N EB", "N EE", "eps_av", "lumi", "cs [nb]", "+-"))
+    for name, r in results.items():
+        print("{:<20}{:>9}{:>9.4f}{:>9.4f}{:>8}{:>8}{:>8.4f}{:>10.1f}{:>10.4f}{:>9.4f}".format(*_row(name, r)))
+
+
+def write_batch(results, path):
+    """Writes the combined results table as csv."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for name, r in results.items():
+            writer.writerow(_row(name, r))
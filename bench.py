@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from bgfit import FIT_HISTOGRAMS, fit_factors, fit_lookup, xsec_factors
+from cache import cache_path, load_wenu, read_cache, read_manifest
+from events import COLUMNS, add_derived
+from figures import HISTOGRAMS, fill_histograms, render_all
+from generate import write_csv
+from selection import REGION, SAMPLES, cut_bits, pattern_counts, sample_mask
+from xsection import cross_section
+
+# benchmark of the stages of the analysis on synthetic events (generate.py) of several sizes: the
+# wall time and the peak of the memory allocated (tracemalloc, numpy included) of every stage are
+# written to a json file, which can be compared with the file of another version
+SIZES = [10**4, 10**5, 10**6]
+STAGES = ["load", "derived", "region split", "ID cuts", "histogramming", "background", "plotting"]
+
+
+def _version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class _Stage:
+    # times one stage and records the memory allocated at its peak; trace=False for the stages
+    # running in worker processes, which would inherit the (slow) tracing and are not measured by it
+    def __init__(self, results, name, trace=True):
+        self.results, self.name, self.trace = results, name, trace
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.reset_peak()
+            self.before = tracemalloc.get_traced_memory()[0]
+        else:
+            tracemalloc.stop()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak = None
+        if self.trace:
+            peak = (tracemalloc.get_traced_memory()[1] - self.before)/2**20
+        else:
+            tracemalloc.start()
+        self.results[self.name] = {"seconds": seconds, "peak_mb": peak}
+
+
+def run_size(n, workdir, seed=0, plots=True, workers=None):
+    """Times every stage of the analysis on n synthetic events, returns {stage: {seconds, peak_mb}}."""
+    csv = os.path.join(workdir, "wenu-{}.csv".format(n))
+    if not os.path.exists(csv):
+        write_csv(csv, n, seed)
+    cache_dir = os.path.join(workdir, "cache")
+    # the load stage always parses the csv and writes the cache, as on the first run
+    shutil.rmtree(cache_path(csv, cache_dir), ignore_errors=True)
+    results = {}
+    tracemalloc.start()
+    try:
+        with _Stage(results, "load"):
+            load_wenu(csv, cache_dir, derived=False)
+            path = cache_path(csv, cache_dir)
+            df = read_cache(path, read_manifest(path), COLUMNS)
+        with _Stage(results, "derived"):
+            add_derived(df)
+        with _Stage(results, "region split"):
+            # (the bitmask of the regions holds the ID cuts too, they are evaluated in one pass)
+            bits = cut_bits(df)
+            masks = {region: sample_mask(bits, region) for region in REGION}
+        with _Stage(results, "ID cuts"):
+            masks.update({sample: sample_mask(bits, sample) for sample in SAMPLES})
+            patterns = pattern_counts(bits)
+        with _Stage(results, "histogramming"):
+            hists = fill_histograms(df, bits, HISTOGRAMS + FIT_HISTOGRAMS)
+        with _Stage(results, "background"):
+            factor = xsec_factors(fit_factors(fit_lookup(hists)))
+            cross_section({r: np.count_nonzero(masks[r + "scut"]) for r in REGION},
+                          {r: np.count_nonzero(masks[r + "sbg"]) for r in REGION}, factor)
+        if plots:
+            with _Stage(results, "plotting", trace=False):
+                render_all(hists, outdir=os.path.join(workdir, "figures"), workers=workers)
+    finally:
+        tracemalloc.stop()
+    results["events"] = int(patterns.sum())
+    return results
+
+
+def run(sizes=SIZES, workdir=None, seed=0, plots=True, workers=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        return {"version": _version(), "python": platform.python_version(), "numpy": np.__version__,
+                "cpus": os.cpu_count(), "seed": seed,
+                "sizes": {str(n): run_size(n, workdir, seed, plots, workers) for n in sizes}}
+
+
+def print_results(results, baseline=None):
+    print("{:>10}  {:<15}{:>10}{:>11}".format("events", "stage", "seconds", "peak MB")
+          + ("{:>10}".format("ratio") if baseline else ""))
+    for n, stages in results["sizes"].items():
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            r = stages[stage]
+            line = "{:>10}  {:<15}{:>10.3f}{:>11}".format(
+                n, stage, r["seconds"], "-" if r["peak_mb"] is None else "{:.1f}".format(r["peak_mb"]))
+            old = (baseline or {}).get("sizes", {}).get(n, {}).get(stage)
+            if old:
+                line += "{:>10.2f}".format(r["seconds"]/old["seconds"])
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of the analysis stages on synthetic events")
+    parser.add_argument("--sizes", type=float, nargs="+", default=SIZES, help="numbers of events")
+    parser.add_argument("--output", default="bench.json", help="json file of the results")
+    parser.add_argument("--compare", help="json file of an earlier benchmark to compare with")
+    parser.add_argument("--workdir", help="directory for the generated csv and cache (kept for reuse)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-plots", dest="plots", action="store_false", help="skip the plotting stage")
+    parser.add_argument("--jobs", type=int, help="worker processes of the plotting stage")
+    args = parser.parse_args()
+    results = run([int(n) for n in args.sizes], args.workdir, args.seed, args.plots, args.jobs)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
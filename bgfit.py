@@ -0,0 +1,91 @@
+import numpy as np
+
+from streaming import BINNING
+from xsection import XSEC_VAR
+
+# fit of the background normalisation: the MET/mt shape of the events failing the ID cuts is the
+# background template, scaled so that it matches the accepted events in the sidebands where we
+# assume there is only background (the extreme MET and mt values). It works on histograms only.
+SIDEBANDS = {"MET": [(0, 15)], "mt": [(0, 30)]}
+# fixed binning of the fitted distributions, the same as in the streaming histograms so that both fits
+# use the same bins (the sideband limits are edges of these bins)
+FIT_BINNING = {var: BINNING[var] for var in SIDEBANDS}
+FIT_HISTOGRAMS = [(region + sample, var, bins, (low, high))
+                  for region in ("EB", "EE") for sample in ("cut", "bg")
+                  for var, (bins, low, high) in FIT_BINNING.items()]
+
+
+def in_windows(edges, windows):
+    """Bins lying completely inside one of the (low, high) windows (the limits must be bin edges)."""
+    inside = np.zeros(len(edges) - 1, dtype=bool)
+    for low, high in windows:
+        if not np.isclose(edges, low).any() or not np.isclose(edges, high).any():
+            raise ValueError("window ({}, {}) does not start and end on bin edges".format(low, high))
+        inside |= (edges[:-1] >= low) & (edges[1:] <= high)
+    return inside
+
+
+def fit_factor(data, template, windows, method="poisson"):
+    """
+    Factor f (and its uncertainty) such that f*template describes data in the windows.
+    poisson: binned likelihood with Poisson data, f = sum(data)/sum(template) in the windows
+    chi2: least squares with the statistical errors of both histograms
+    """
+    inside = in_windows(data.edges, windows)
+    d, b = data.counts[inside], template.counts[inside]
+    if b.sum() <= 0 or d.sum() <= 0:
+        raise ValueError("no events in the sidebands {}".format(windows))
+    f = d.sum()/b.sum()
+    if method == "poisson":
+        return float(f), float(f*np.sqrt(1/d.sum() + template.sumw2[inside].sum()/b.sum()**2))
+    if method != "chi2":
+        raise ValueError("unknown fit method " + method)
+    for _ in range(10):
+        # the variance depends on f through the template errors, a few iterations converge
+        var = data.sumw2[inside] + f*f*template.sumw2[inside]
+        var[var == 0] = 1
+        f = (d*b/var).sum()/(b*b/var).sum()
+    return float(f), float(1/np.sqrt((b*b/var).sum()))
+
+
+def fit_factors(lookup, sidebands=SIDEBANDS, method="poisson"):
+    """
+    lookup(sample, var) gives the histogram of var for the sample ("EBcut", "EBbg", ...)
+    returns {region: {var: (factor, error)}}
+    """
+    return {region: {var: fit_factor(lookup(region + "cut", var), lookup(region + "bg", var), windows,
+                                     method)
+                     for var, windows in sidebands.items()}
+            for region in ("EB", "EE")}
+
+
+def fit_lookup(hists):
+    """lookup for fit_factors in the histograms filled from FIT_HISTOGRAMS."""
+    def lookup(sample, var):
+        bins, low, high = FIT_BINNING[var]
+        return hists[(sample, var, bins, (low, high))]
+    return lookup
+
+
+def central(factors):
+    """The fitted factors without their errors, {region: {var: factor}} (as xsection.BG_FACTORS)."""
+    return {region: {var: f for var, (f, err) in fits.items()} for region, fits in factors.items()}
+
+
+def xsec_factors(factors):
+    """The fitted factor of each region used in the cross section (see xsection.XSEC_VAR)."""
+    return {region: factors[region][var][0] for region, var in XSEC_VAR.items()}
+
+
+def xsec_errors(factors):
+    """The uncertainty of the fitted factor of each region used in the cross section."""
+    return {region: factors[region][var][1] for region, var in XSEC_VAR.items()}
+
+
+def print_factors(factors, hand_tuned=None):
+    for region, fits in factors.items():
+        for var, (f, err) in fits.items():
+            line = "Background factor {} {}: {:.4f} +- {:.4f}".format(region, var, f, err)
+            if hand_tuned:
+                line += " (hand-tuned {})".format(hand_tuned[region][var])
+            print(line)
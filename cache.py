@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from download import download_all, open_download
+from events import DERIVED, add_derived, compact_column
+from instrument import stage
+from selection import preselect
+
+# local columnar cache of the event data: the csv is downloaded (or read from a local path) once
+# and every column is stored as a separate .npy file, which later runs memory-map instead of
+# parsing the text again. The manifest keeps the sha256 of every file so a broken cache is noticed.
+CACHE_DIR = os.environ.get("WENU_CACHE", ".wenu_cache")
+MANIFEST = "manifest.json"
+# events per block of load_selected
+LOAD_BLOCK = 1 << 20
+
+
+def _is_url(source):
+    return source.startswith(("http://", "https://"))
+
+
+def _sha256(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(source, cache_dir=CACHE_DIR, compact=False):
+    """Directory holding the cache of one source (url or local file), or its compact copy."""
+    name = os.path.splitext(os.path.basename(source.rstrip("/")))[0] or "data"
+    key = hashlib.sha1(source.encode()).hexdigest()[:8]
+    path = os.path.join(cache_dir, "{}-{}".format(name, key))
+    return os.path.join(path, "compact") if compact else path
+
+
+def _source_stamp(source):
+    # a local file is re-read when it changes, a url is trusted once downloaded
+    if _is_url(source):
+        return None
+    st = os.stat(source)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def fetch(source, path, checksum=None):
+    """
+    Returns a local copy of the csv, downloading it into path if source is a url (resumed if an
+    earlier download was interrupted, see download.py). checksum: expected checksum of the file
+    """
+    if not _is_url(source):
+        return source
+    return download_all({source: os.path.join(path, "raw.csv")}, {source: checksum})[0]
+
+
+def run_index(run):
+    """Run numbers and offsets of the events grouped by run: run i is rows offsets[i]:offsets[i + 1]."""
+    starts = np.flatnonzero(np.diff(run)) + 1
+    return {"runs": [int(r) for r in run[np.r_[0, starts]]] if len(run) else [],
+            "offsets": [0] + [int(i) for i in starts] + [len(run)]}
+
+
+def write_cache(df, path, source=None, source_sha256=None):
+    """
+    Stores every column of df as <column>.npy in path together with a checksummed manifest.
+    The events are stored grouped by run (stable order within a run) with the offsets of every run
+    in the manifest, so one run is a slice of the columns.
+    """
+    os.makedirs(path, exist_ok=True)
+    run = df["Run"].to_numpy()
+    if np.any(np.diff(run) < 0):
+        df = df.iloc[np.argsort(run, kind="stable")]
+    columns = {}
+    for col in df.columns:
+        fname = col + ".npy"
+        np.save(os.path.join(path, fname), np.ascontiguousarray(df[col].to_numpy()))
+        columns[col] = {"file": fname, "dtype": str(df[col].dtype),
+                        "sha256": _sha256(os.path.join(path, fname))}
+    manifest = {"source": source, "source_stamp": _source_stamp(source) if source else None,
+                "source_sha256": source_sha256, "rows": len(df), "columns": columns,
+                "run_index": run_index(df["Run"].to_numpy())}
+    # the manifest is written last, so an interrupted write never looks like a valid cache
+    with open(os.path.join(path, MANIFEST + ".part"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(path, MANIFEST + ".part"), os.path.join(path, MANIFEST))
+    return manifest
+
+
+def verify_cache(path, manifest=None):
+    """Recomputes the checksums of all cached columns, raises ValueError on a mismatch."""
+    manifest = manifest or read_manifest(path)
+    for col, meta in manifest["columns"].items():
+        if _sha256(os.path.join(path, meta["file"])) != meta["sha256"]:
+            raise ValueError("cache column {} in {} is corrupted".format(col, path))
+
+
+def read_cache(path, manifest=None, columns=None, rows=None):
+    """
+    Memory-maps the cached columns (all of them or just `columns`) into a DataFrame.
+    rows: (start, stop) slice of the events, e.g. one run of the run index
+    """
+    manifest = manifest or read_manifest(path)
+    columns = columns or list(manifest["columns"])
+    data = {col: np.load(os.path.join(path, manifest["columns"][col]["file"]), mmap_mode="r")
+            for col in columns}
+    for col, arr in data.items():
+        if len(arr) != manifest["rows"]:
+            raise ValueError("cache column {} in {} has a wrong length".format(col, path))
+    if rows is not None:
+        data = {col: arr[rows[0]:rows[1]] for col, arr in data.items()}
+    return pd.DataFrame(data, copy=False)
+
+
+def compact_cache(path, manifest):
+    """
+    Returns the directory of the compact (float32/int8) copy of the cache in path, making it
+    column by column from the full cache if needed.
+    """
+    sub = os.path.join(path, "compact")
+    done = read_manifest(sub)
+    if done is not None and done["parent"] == manifest["columns"]:
+        return sub, done
+    os.makedirs(sub, exist_ok=True)
+    columns = {}
+    for col, meta in manifest["columns"].items():
+        x = compact_column(col, np.load(os.path.join(path, meta["file"]), mmap_mode="r"))
+        np.save(os.path.join(sub, meta["file"]), x)
+        columns[col] = {"file": meta["file"], "dtype": str(x.dtype),
+                        "sha256": _sha256(os.path.join(sub, meta["file"]))}
+        del x
+    done = dict(manifest, columns=columns, parent=manifest["columns"])
+    with open(os.path.join(sub, MANIFEST + ".part"), "w") as f:
+        json.dump(done, f, indent=1)
+    os.replace(os.path.join(sub, MANIFEST + ".part"), os.path.join(sub, MANIFEST))
+    return sub, done
+
+
+def load_wenu(source, cache_dir=CACHE_DIR, offline=None, derived=True, verify=False, compact=False,
+              checksum=None):
+    """
+    Loads the events from source (url or local csv) through the local cache.
+    offline: never touch the network or the csv, fail right away if there is no cache
+             (defaults to the WENU_OFFLINE environment variable)
+    derived: keep iTpT, iEpT, iHpT and mt in the cache too, so they are not recomputed
+    verify: check the sha256 of every cached column before using it
+    compact: memory-map the float32/int8 copy of the cache (see events.compact_column)
+    checksum: expected checksum of the downloaded csv ("adler32:...", "sha256:...")
+    """
+    if offline is None:
+        offline = os.environ.get("WENU_OFFLINE", "") not in ("", "0")
+    path = cache_path(source, cache_dir)
+    manifest = read_manifest(path)
+
+    if manifest is None and offline:
+        raise FileNotFoundError("offline mode: no cache for {} in {}".format(source, path))
+    if manifest is not None and not offline and manifest["source_stamp"] != _source_stamp(source):
+        manifest = None
+    if manifest is not None and not offline and derived \
+            and not set(DERIVED) <= set(manifest["columns"]):
+        manifest = None
+    if manifest is not None and not offline and "run_index" not in manifest:
+        # cache written before the events were grouped by run
+        manifest = None
+
+    if manifest is None:
+        raw = os.path.join(path, "raw.csv")
+        if _is_url(source) and not os.path.exists(raw):
+            # the csv is parsed while it is downloaded
+            with stage("fetch and read csv") as st:
+                with open_download(source, raw, checksum) as f:
+                    df = pd.read_csv(f)
+                st.events = len(df)
+        else:
+            with stage("fetch"):
+                raw = fetch(source, path, checksum)
+            with stage("read csv") as st:
+                df = pd.read_csv(raw)
+                st.events = len(df)
+        if derived:
+            with stage("derived", len(df)):
+                add_derived(df)
+        with stage("write cache", len(df)):
+            manifest = write_cache(df, path, source, _sha256(raw))
+    if compact:
+        with stage("compact cache", manifest["rows"]):
+            path, manifest = compact_cache(path, manifest)
+    if verify:
+        with stage("verify cache", manifest["rows"]):
+            verify_cache(path, manifest)
+
+    df = read_cache(path, manifest)
+    if not set(DERIVED) <= set(df.columns):
+        with stage("derived", len(df)):
+            add_derived(df)
+    return df
+
+
+def load_selected(source, cache_dir=CACHE_DIR, columns=None, where=None, offline=None, derived=True,
+                  compact=False, block=LOAD_BLOCK):
+    """
+    Loads only `columns` of the events passing `where` (e.g. selection.compile_preselection()) into
+    memory. The cut columns are read block by block from the memory-mapped cache first, then only the
+    selected rows of the other columns are copied, so the memory follows the selected events and the
+    used columns, not the whole file.
+    """
+    df = load_wenu(source, cache_dir, offline=offline, derived=derived, compact=compact)
+    columns = columns or list(df.columns)
+    n = len(df)
+    if where is None:
+        return pd.DataFrame({col: np.array(df[col]) for col in columns}, copy=False)
+    masks = [preselect(df.iloc[start:start + block], where) for start in range(0, n, block)]
+    selected = sum(int(np.count_nonzero(m)) for m in masks)
+    out = {}
+    for col in columns:
+        x = np.asarray(df[col])
+        out[col] = np.empty(selected, dtype=x.dtype)
+        i = 0
+        for start, mask in zip(range(0, n, block), masks):
+            part = x[start:start + block][mask]
+            out[col][i:i + len(part)] = part
+            i += len(part)
+    return pd.DataFrame(out, copy=False)
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache import CACHE_DIR, load_wenu
+from selection import SPEC
+
+# chunked event store: the events of every run, the ones below the pt threshold of the regions first,
+# each group sorted by |eta|, are cut into chunks of CHUNK_ROWS events (never spanning two runs, groups
+# or the limits of the regions in |eta|), every chunk is one compressed .npz with a file per column, and the index keeps the min/max
+# of eta, |eta|, pt, MET, mt and the run of every chunk. A reader skips the chunks that cannot have
+# events in the regions (all the chunks below the pt threshold and the ones in the |eta| gap between
+# EB and EE or beyond EE), in the signal region or in a run range without opening them, and only
+# decompresses the columns it asks for. The chunks are small so that the |eta| zones are narrow.
+INDEX = "index.json"
+CHUNK_ROWS = 1 << 12
+ZONE_COLUMNS = ["Run", "eta", "pt", "MET", "mt"]
+
+
+def _zones(df):
+    zones = {col: [float(df[col].min()), float(df[col].max())] for col in ZONE_COLUMNS}
+    abs_eta = np.abs(df["eta"].to_numpy())
+    zones["abs_eta"] = [float(abs_eta.min()), float(abs_eta.max())]
+    return zones
+
+
+def write_store(source, path, cache_dir=CACHE_DIR, chunk_rows=CHUNK_ROWS, spec=SPEC):
+    """
+    Converts the events of source (csv url or path, through the columnar cache) into a chunk store.
+    spec: selection whose pt threshold groups the events of a run
+    """
+    df = load_wenu(source, cache_dir)
+    above = df["pt"].to_numpy() > spec["pt_min"]
+    abs_eta = np.abs(df["eta"].to_numpy())
+    order = np.lexsort((abs_eta, above, df["Run"].to_numpy()))
+    run = df["Run"].to_numpy()[order]
+    # |eta| interval between the limits of the regions (EB, gap, EE, beyond)
+    limits = sorted({x for region in spec["regions"].values() for x in region if x is not None})
+    interval = np.searchsorted(limits, abs_eta[order])
+    # chunk boundaries: at every new run, pt group or |eta| interval, and every chunk_rows events within them
+    new = (np.diff(run) != 0) | (np.diff(above[order]) != 0) | (np.diff(interval) != 0)
+    firsts = np.concatenate([[0], np.flatnonzero(new) + 1])
+    lasts = np.append(firsts[1:], len(run))
+    starts = np.concatenate([np.arange(first, last, chunk_rows) for first, last in zip(firsts, lasts)])
+    bounds = list(zip(starts, list(starts[1:]) + [len(run)]))
+    os.makedirs(path, exist_ok=True)
+    chunks = []
+    for i, (start, stop) in enumerate(bounds):
+        part = df.iloc[order[start:stop]]
+        fname = "chunk{:06d}.npz".format(i)
+        np.savez_compressed(os.path.join(path, fname), **{col: part[col].to_numpy() for col in df.columns})
+        chunks.append({"file": fname, "rows": int(stop - start), "zones": _zones(part)})
+    index = {"source": source, "rows": len(df), "columns": {col: str(df[col].dtype) for col in df.columns},
+             "chunks": chunks}
+    with open(os.path.join(path, INDEX + ".part"), "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(os.path.join(path, INDEX + ".part"), os.path.join(path, INDEX))
+    return index
+
+
+def read_index(path):
+    try:
+        with open(os.path.join(path, INDEX)) as f:
+            return json.load(f)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _overlaps(zone, low, high):
+    return (low is None or zone[1] > low) and (high is None or zone[0] < high)
+
+
+def may_pass(zones, spec=SPEC, signal=False, runs=None):
+    """
+    Whether a chunk with these zones can hold events in the regions of spec (pt and |eta| cuts),
+    in the signal region too if signal, and in the (first, last) run range if given.
+    """
+    if runs is not None and not (zones["Run"][1] >= runs[0] and zones["Run"][0] <= runs[1]):
+        return False
+    if zones["pt"][1] <= spec["pt_min"]:
+        return False
+    if not any(_overlaps(zones["abs_eta"], *limits) for limits in spec["regions"].values()):
+        return False
+    if signal and not all(zones[var][1] > low for var, low in spec["signal"].items()):
+        return False
+    return True
+
+
+def scan_store(path, columns=None, spec=SPEC, signal=False, runs=None, index=None):
+    """
+    Yields (chunk index entry, DataFrame of `columns`) for the chunks which may pass the cuts, the
+    other chunks are not read. Rows are not filtered, the cuts are applied as usual afterwards.
+    """
+    index = index or read_index(path)
+    columns = columns or list(index["columns"])
+    for chunk in index["chunks"]:
+        if may_pass(chunk["zones"], spec, signal, runs):
+            with np.load(os.path.join(path, chunk["file"])) as f:
+                yield chunk, pd.DataFrame({col: f[col] for col in columns}, copy=False)
+
+
+def load_store(path, columns=None, spec=SPEC, signal=False, runs=None):
+    """The events of the chunks which may pass the cuts, as one DataFrame."""
+    parts = [df for _, df in scan_store(path, columns, spec, signal, runs)]
+    index = read_index(path)
+    if not parts:
+        return pd.DataFrame({col: np.array([], dtype=index["columns"][col])
+                             for col in columns or index["columns"]})
+    return pd.concat(parts, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert Wenu.csv into a chunk store with zone maps")
+    parser.add_argument("source", help="url or path of the csv")
+    parser.add_argument("output", help="directory of the chunk store")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    index = write_store(args.source, args.output, args.cache_dir, args.chunk_rows)
+    skipped = sum(not may_pass(chunk["zones"]) for chunk in index["chunks"])
+    print("{} events in {} chunks, {} of them outside the regions".format(index["rows"], len(index["chunks"]),
+                                                                         skipped))
@@ -0,0 +1,59 @@
+import numpy as np
+
+from selection import ANY_FAIL, ID_VARS, PASS, REGION, SAMPLES, SIGNAL, select
+
+# count cube: one pass over the events fills counts with the axes
+#   region (EB, EE) x charge (-1, other, +1) x ID cuts passed (5 bits) x any ID cut failed x signal region
+# The counts of every selection, the acceptances and the charge asymmetry are then sums over slices of
+# the cube. The events outside both regions are not in the cube, no selection of the analysis uses them.
+# Only Q == +1 and Q == -1 count for a charge, as in the charge counts of the original analysis.
+CHARGES = (-1, 0, 1)
+SHAPE = (len(REGION), len(CHARGES), 1 << len(ID_VARS), 2, 2)
+N_CELLS = int(np.prod(SHAPE))
+
+
+def _representatives():
+    # one bitmask per cell, giving the same answers to selection.select as the events of the cell
+    region, charge, passed, failed, signal = np.indices(SHAPE).reshape(len(SHAPE), -1)
+    regions = np.array(list(REGION.values()), dtype=np.uint16)
+    bits = regions[region] | passed.astype(np.uint16)
+    bits |= np.where(failed == 1, ANY_FAIL, 0).astype(np.uint16)
+    bits |= np.where(signal == 1, SIGNAL, 0).astype(np.uint16)
+    return bits, np.array(CHARGES)[charge]
+
+
+CELL_BITS, CELL_CHARGE = _representatives()
+
+
+def cells(bits, Q):
+    """Cell of the cube of every event, -1 outside the regions."""
+    region = np.full(len(bits), -1, dtype=np.intp)
+    for i, r in enumerate(REGION):
+        region[(bits & REGION[r]) != 0] = i
+    Q = np.asarray(Q)
+    charge = np.where(Q == 1, 2, np.where(Q == -1, 0, 1))
+    passed = (bits & sum(PASS.values())).astype(np.intp)
+    failed = ((bits & ANY_FAIL) != 0).astype(np.intp)
+    signal = ((bits & SIGNAL) != 0).astype(np.intp)
+    cell = np.ravel_multi_index((np.maximum(region, 0), charge, passed, failed, signal), SHAPE)
+    cell[region < 0] = -1
+    return cell
+
+
+def fill_cube(events, bits):
+    """Fills the cube of the events (with their cut bitmask), returns {"counts": ...}."""
+    cell = cells(bits, events["Q"])
+    return {"counts": np.bincount(cell[cell >= 0], minlength=N_CELLS).reshape(SHAPE)}
+
+
+def cube_mask(sample=None, charge=None, **kwargs):
+    """Cells of one of the SAMPLES (or of a selection with the arguments of selection.select) and charge."""
+    mask = select(CELL_BITS, **(SAMPLES[sample] if sample else kwargs))
+    if charge is not None:
+        mask &= CELL_CHARGE == charge
+    return mask.reshape(SHAPE)
+
+
+def cube_count(cube, sample=None, charge=None, **kwargs):
+    """Number of events of a selection (arguments of cube_mask)."""
+    return int(cube["counts"][cube_mask(sample, charge, **kwargs)].sum())
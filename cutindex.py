@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from cache import read_cache, read_manifest
+from selection import ID_VARS, REGION, SPEC, compile_selection, cut_bits, select
+
+# sorted per-variable index of the events of every region: for each (region, variable) the values in
+# ascending order and their positions among the events of the region. The number of events of a region
+# with low < var < high is then two binary searches, and several cuts are combined by intersecting the
+# bitmaps of the positions of every cut (packed, 8 events per byte). The index is built lazily, one
+# (region, variable) at a time, and kept in the cache directory under a key of the column checksums and
+# the regions of the spec, so it is rebuilt when the data or the regions change.
+VARIABLES = ID_VARS + ["pt", "eta", "MET", "mt"]
+
+
+def _save(path, x):
+    with open(path + ".part", "wb") as f:
+        np.save(f, x)
+    os.replace(path + ".part", path)
+
+
+class CutIndex:
+    """Lazily built sorted index of the events of a cache (path) per region and variable."""
+
+    def __init__(self, path, manifest=None, spec=SPEC, df=None):
+        self.manifest = manifest or read_manifest(path)
+        # df: events with the derived columns if they are not stored in the cache
+        self.df = df if df is not None else read_cache(path, self.manifest)
+        self.spec = spec
+        key = hashlib.sha256(json.dumps([{col: meta["sha256"] for col, meta in self.manifest["columns"].items()},
+                                         spec["pt_min"], spec["regions"]], sort_keys=True).encode())
+        root = os.path.join(path, "index")
+        self.dir = os.path.join(root, key.hexdigest()[:16])
+        if not os.path.isdir(self.dir):
+            # an index of other data or other regions is never used again
+            shutil.rmtree(root, ignore_errors=True)
+            os.makedirs(self.dir)
+        self.loaded = {}
+        # the service answers queries in threads: one of them builds a missing part, the others wait
+        # (reentrant, making a column loads the rows of its region)
+        self.lock = threading.RLock()
+
+    def _load(self, name, make):
+        if name not in self.loaded:
+            with self.lock:
+                if name not in self.loaded:
+                    path = os.path.join(self.dir, name + ".npy")
+                    if not os.path.exists(path):
+                        _save(path, make())
+                    self.loaded[name] = np.load(path, mmap_mode="r")
+        return self.loaded[name]
+
+    def rows(self, region):
+        """Event numbers (ascending) of the events in region."""
+        def make():
+            bits = cut_bits(self.df, compile_selection(self.spec))
+            return np.flatnonzero(select(bits, region)).astype(np.int64)
+        return self._load(region + ".rows", make)
+
+    def column(self, region, var):
+        """Sorted values of var in region (NaN last) and their positions among the events of the region."""
+        def values():
+            return np.asarray(self.df[var])[self.rows(region)][order()]
+
+        def order():
+            return self._load("{}-{}.order".format(region, var), lambda: np.argsort(
+                np.asarray(self.df[var])[self.rows(region)], kind="stable").astype(np.int64))
+        return self._load("{}-{}.values".format(region, var), values), order()
+
+    def build(self):
+        """Builds the index of every region and variable at once."""
+        for region in REGION:
+            for var in VARIABLES:
+                self.column(region, var)
+
+    def _span(self, region, var, low=None, high=None):
+        # first and last + 1 sorted positions with low < value < high
+        values, _ = self.column(region, var)
+        start = 0 if low is None else np.searchsorted(values, low, "right")
+        # NaN sorts last and passes no cut
+        stop = np.searchsorted(values, np.nan if high is None else high, "left")
+        return int(start), int(max(stop, start))
+
+    def count(self, region, var, low=None, high=None):
+        """Number of events in region with low < var < high (None = no limit), by binary search."""
+        start, stop = self._span(region, var, low, high)
+        return stop - start
+
+    def bitmap(self, region, var, low=None, high=None):
+        """Packed bitmap over the events of region of low < var < high."""
+        start, stop = self._span(region, var, low, high)
+        mask = np.zeros(len(self.rows(region)), dtype=bool)
+        mask[self.column(region, var)[1][start:stop]] = True
+        return np.packbits(mask)
+
+    def count_all(self, region, cuts):
+        """Number of events in region passing all the cuts {var: (low, high)}."""
+        if not cuts:
+            return len(self.rows(region))
+        if len(cuts) == 1:
+            (var, limits), = cuts.items()
+            return self.count(region, var, *limits)
+        bits = None
+        for var, limits in cuts.items():
+            b = self.bitmap(region, var, *limits)
+            bits = b if bits is None else np.bitwise_and(bits, b, out=bits)
+        return int(np.bitwise_count(bits).sum())
+
+    def n1(self, region, cuts):
+        """{var: number of events in region passing all the cuts except the one on var}."""
+        bitmaps = {var: self.bitmap(region, var, *limits) for var, limits in cuts.items()}
+        out = {}
+        for var in cuts:
+            others = [b for other, b in bitmaps.items() if other != var]
+            if not others:
+                out[var] = len(self.rows(region))
+                continue
+            bits = others[0].copy()
+            for b in others[1:]:
+                np.bitwise_and(bits, b, out=bits)
+            out[var] = int(np.bitwise_count(bits).sum())
+        return out
@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import hashlib
+import http.server
+import io
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# downloads of the open data files: a file is cut into SEGMENT byte ranges fetched by up to CONNECTIONS
+# concurrent HTTP range requests (shared by all the files of a bulk pull, so many files or one large
+# file keep the bandwidth busy instead of waiting on the latency of one request). Every block is
+# written at its offset into <path>.part and the bytes done of every segment are kept in
+# <path>.part.json, so an interrupted download only fetches what is missing. The checksum is verified
+# before <path>.part is renamed to path. Servers without range requests get one plain request.
+# open_download() lets a parser read the file while it is being downloaded.
+SEGMENT = 8 << 20
+CONNECTIONS = 8
+BLOCK = 1 << 20
+RETRIES = 3
+TIMEOUT = 60
+
+
+class _Adler32:
+    # the checksums of the CERN open data records are adler32
+    def __init__(self):
+        self.value = 1
+
+    def update(self, data):
+        self.value = zlib.adler32(data, self.value)
+
+    def hexdigest(self):
+        return "{:08x}".format(self.value)
+
+
+ALGORITHMS = {"sha256": hashlib.sha256, "md5": hashlib.md5, "adler32": _Adler32}
+
+
+def checksum(path, algorithm="sha256"):
+    h = ALGORITHMS[algorithm]()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(BLOCK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _parse_checksum(expected):
+    # "adler32:0a1b2c3d", "sha256:..." or a bare sha256
+    algorithm, _, value = expected.rpartition(":")
+    return algorithm or "sha256", value.lower()
+
+
+def _probe(url):
+    """Size and ETag of the file if the server answers range requests, (None, None) otherwise."""
+    req = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
+        match = re.match(r"bytes 0-0/(\d+)", r.headers.get("Content-Range", ""))
+        if r.status == 206 and match:
+            return int(match.group(1)), r.headers.get("ETag")
+        return None, None
+
+
+class _Progress:
+    # bytes done of every segment, saved next to the .part file; readers wait on the contiguous prefix
+    def __init__(self, path, size, etag, segment):
+        self.path, self.size = path, size
+        self.meta = {"size": size, "etag": etag, "segment": segment, "done": {}}
+        self.cond = threading.Condition()
+        self.finished = False
+        self.error = None
+        try:
+            with open(path + ".part.json") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = None
+        if meta is not None and {k: meta.get(k) for k in ("size", "etag", "segment")} == \
+                {k: self.meta[k] for k in ("size", "etag", "segment")} and os.path.exists(path + ".part"):
+            self.meta = meta
+        else:
+            with open(path + ".part", "wb") as f:
+                if size:
+                    f.truncate(size)
+            self.save()
+
+    def done(self, start):
+        return self.meta["done"].get(str(start), 0)
+
+    def add(self, start, n):
+        with self.cond:
+            self.meta["done"][str(start)] = self.done(start) + n
+            self.cond.notify_all()
+        self.save()
+
+    def save(self):
+        with self.cond:
+            text = json.dumps(self.meta)
+            with open(self.path + ".part.json.tmp", "w") as f:
+                f.write(text)
+            os.replace(self.path + ".part.json.tmp", self.path + ".part.json")
+
+    def prefix(self):
+        # bytes available from the start of the file
+        segment, n = self.meta["segment"], 0
+        if segment is None:
+            return self.done(0)
+        while True:
+            done = self.done(n)
+            n += done
+            if self.size is not None and n >= self.size:
+                return self.size
+            if done < segment:
+                return n
+
+    def finish(self, error=None):
+        with self.cond:
+            self.finished, self.error = True, error
+            self.cond.notify_all()
+
+
+def _get(url, path, progress, start, stop):
+    """Fetches bytes start:stop (to the end if stop is None) into the .part file, resuming and retrying."""
+    for attempt in range(RETRIES + 1):
+        offset = start + progress.done(start)
+        if stop is not None and offset >= stop:
+            return
+        headers = {}
+        if stop is not None:
+            headers["Range"] = "bytes={}-{}".format(offset, stop - 1)
+        elif offset:
+            # a plain request cannot resume
+            with progress.cond:
+                progress.meta["done"][str(start)] = 0
+            offset = start
+        try:
+            req = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(req, timeout=TIMEOUT) as r, open(path + ".part", "r+b") as f:
+                if headers and r.status != 206:
+                    raise ValueError("no range request support for {}".format(url))
+                f.seek(offset)
+                for chunk in iter(lambda: r.read(BLOCK), b""):
+                    f.write(chunk)
+                    f.flush()
+                    progress.add(start, len(chunk))
+            if stop is None or start + progress.done(start) >= stop:
+                return
+            raise ConnectionError("connection closed at byte {} of {}".format(
+                start + progress.done(start), url))
+        except OSError:
+            # URLError and the socket errors
+            if attempt == RETRIES:
+                raise
+            time.sleep(2**attempt)
+
+
+async def download(url, path, expected=None, connections=None, segment=SEGMENT, progress=None):
+    """
+    Downloads url into path (nothing to do if it is already there and matches expected) with concurrent
+    range requests, resuming a previous partial download. expected: checksum ("adler32:...", "sha256:..."
+    or a bare sha256) verified before the file is moved into place.
+    connections: an asyncio.Semaphore shared by several downloads, or their number
+    progress: list the _Progress of the download is appended to (for open_download)
+    """
+    if os.path.exists(path):
+        if expected is None:
+            return path
+        algorithm, value = _parse_checksum(expected)
+        if await asyncio.to_thread(checksum, path, algorithm) == value:
+            return path
+        # not the file at url (e.g. an older version of it), downloaded again
+        os.remove(path)
+    if not isinstance(connections, asyncio.Semaphore):
+        connections = asyncio.Semaphore(connections or CONNECTIONS)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    async with connections:
+        size, etag = await asyncio.to_thread(_probe, url)
+    state = _Progress(path, size, etag, segment if size is not None else None)
+    if progress is not None:
+        progress.append(state)
+    if size is None:
+        ranges = [(0, None)]
+    else:
+        ranges = [(start, min(start + segment, size)) for start in range(0, size, segment)]
+
+    async def get(start, stop):
+        async with connections:
+            await asyncio.to_thread(_get, url, path, state, start, stop)
+
+    try:
+        await asyncio.gather(*[get(start, stop) for start, stop in ranges])
+        if expected is not None:
+            algorithm, value = _parse_checksum(expected)
+            found = await asyncio.to_thread(checksum, path + ".part", algorithm)
+            if found != value:
+                os.remove(path + ".part")
+                os.remove(path + ".part.json")
+                raise ValueError("{} checksum of {} is {}, expected {}".format(algorithm, url, found, value))
+    except BaseException as error:
+        state.finish(error)
+        raise
+    os.replace(path + ".part", path)
+    os.remove(path + ".part.json")
+    state.finish()
+    return path
+
+
+def _threads(connections):
+    # the requests are blocking calls in threads, as many threads as connections
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(connections or CONNECTIONS))
+
+
+async def _download_all(files, expected, connections, segment):
+    _threads(connections)
+    semaphore = asyncio.Semaphore(connections or CONNECTIONS)
+    return await asyncio.gather(*[download(url, path, expected.get(url), semaphore, segment)
+                                  for url, path in files.items()])
+
+
+def download_all(files, expected=None, connections=None, segment=SEGMENT):
+    """Downloads {url: path} concurrently (sharing `connections` range requests), returns the paths."""
+    return asyncio.run(_download_all(files, expected or {}, connections, segment))
+
+
+class _Reader(io.RawIOBase):
+    # reads the .part file of a running download up to the bytes already there
+    def __init__(self, path, progress):
+        try:
+            self.f = open(path + ".part", "rb")
+        except FileNotFoundError:
+            # the download already finished and moved the file into place (or failed)
+            with progress.cond:
+                progress.cond.wait_for(lambda: progress.finished)
+            if progress.error is not None:
+                raise progress.error
+            self.f = open(path, "rb")
+        self.progress = progress
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        p = self.progress
+        with p.cond:
+            while not p.finished and p.prefix() <= self.pos:
+                p.cond.wait()
+            if p.error is not None:
+                raise p.error
+            end = p.size if p.finished and p.size is not None else p.prefix()
+        n = min(len(buffer), end - self.pos)
+        if n <= 0:
+            return 0
+        self.f.seek(self.pos)
+        n = self.f.readinto(memoryview(buffer)[:n])
+        self.pos += n
+        return n
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+@contextlib.contextmanager
+def open_download(url, path, expected=None, connections=None, segment=SEGMENT):
+    """
+    Binary file object of url which can be read while it is downloaded into path (the segments are
+    requested in order). The download (and its checksum) is complete when the block exits.
+    """
+    progress = []
+    errors = []
+    started = threading.Event()
+
+    def target():
+        async def main():
+            _threads(connections)
+            task = asyncio.ensure_future(download(url, path, expected, connections, segment, progress))
+            while not progress and not task.done():
+                await asyncio.sleep(0.01)
+            started.set()
+            return await task
+        try:
+            asyncio.run(main())
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            started.set()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    started.wait()
+    if not progress:
+        # already downloaded, or failed before the first byte
+        thread.join()
+        if errors:
+            raise errors[0]
+        with open(path, "rb") as f:
+            yield f
+        return
+    with io.BufferedReader(_Reader(path, progress[0]), BLOCK) as f:
+        yield f
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """Local stand-in of the open data server: static files with range requests."""
+
+    def send_head(self):
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        stop = min(int(match.group(2)) + 1 if match.group(2) else size, size)
+        if start >= size:
+            self.send_error(416)
+            return None
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(stop - start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", "bytes {}-{}/{}".format(start, stop - 1, size))
+        self.send_header("Content-Length", str(stop - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return io.BytesIO(body)
+
+
+def serve(directory=".", port=8000):
+    """Serves directory on localhost:port with range requests until interrupted."""
+    handler = functools.partial(RangeHandler, directory=directory)
+    with http.server.ThreadingHTTPServer(("127.0.0.1", port), handler) as server:
+        print("serving {} on http://127.0.0.1:{}/".format(directory, server.server_address[1]))
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="download open data files, or serve files for testing")
+    sub = parser.add_subparsers(dest="command", required=True)
+    get = sub.add_parser("get", help="download urls into a directory")
+    get.add_argument("urls", nargs="+")
+    get.add_argument("--output-dir", default=".")
+    get.add_argument("--checksum", action="append", default=[],
+                     help="expected checksum of the urls, in the same order (adler32:..., sha256:...)")
+    get.add_argument("--connections", type=int, default=CONNECTIONS)
+    srv = sub.add_parser("serve", help="serve a directory with range requests (local stand-in server)")
+    srv.add_argument("directory", nargs="?", default=".")
+    srv.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.directory, args.port)
+    else:
+        files = {url: os.path.join(args.output_dir, os.path.basename(url.rstrip("/"))) for url in args.urls}
+        for path in download_all(files, dict(zip(args.urls, args.checksum)), args.connections):
+            print(path)
@@ -0,0 +1,44 @@
+import numpy as np
+
+# the Wenu.csv file from the CMS open data portal
+URL = "http://opendata.cern.ch/record/545/files/Wenu.csv"
+
+# columns of Wenu.csv and the variables we compute from them
+COLUMNS = ["Run", "Event", "pt", "eta", "phi", "Q", "MET", "phiMET",
+           "sigmaEtaEta", "HoverE", "isoTrack", "isoEcal", "isoHcal"]
+DERIVED = ["iTpT", "iEpT", "iHpT", "mt"]
+
+
+def add_derived(df):
+    """Adds the iso/pt ratios and the transverse mass mt to df (in place)."""
+    df["iTpT"] = df["isoTrack"]/df["pt"]
+    df["iEpT"] = df["isoEcal"]/df["pt"]
+    df["iHpT"] = df["isoHcal"]/df["pt"]
+    df["mt"] = np.sqrt(2 * df["pt"] * df["MET"]*(1 - np.cos(df['phi'] - df['phiMET'])))
+    return df
+
+
+def _smallest_int(x):
+    # smallest integer type holding all the values of x
+    if len(x) == 0:
+        return np.int8
+    low, high = x.min(), x.max()
+    if low >= 0:
+        return np.min_scalar_type(high)
+    return np.result_type(np.min_scalar_type(low), np.min_scalar_type(-high - 1))
+
+
+def compact_column(col, x):
+    """Memory-lean version of one column: float32, int8 charge, smallest integers for Run and Event."""
+    x = np.asarray(x)
+    if col == "Q":
+        return x.astype(np.int8)
+    if col in ("Run", "Event"):
+        return x.astype(_smallest_int(x))
+    if x.dtype.kind == "f":
+        return x.astype(np.float32)
+    return x
+
+
+def bytes_per_event(df):
+    return df.memory_usage(index=False, deep=True).sum()/max(len(df), 1)
@@ -0,0 +1,282 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from histograms import Hist
+from selection import sample_mask
+from xsection import BG_FACTORS
+
+# every histogram of the figures as (sample, variable, bins, range), filled once from the events
+# (range None = from the minimum to the maximum of the values, like plt.hist does)
+HISTOGRAMS = [
+    # Fig1, Fig2: distributions in the EB and EE regions
+    ("EB", "eta", 50, (-1.5, 1.5)), ("EB", "pt", 50, (20, 100)), ("EB", "Q", 3, (-1, 1)),
+    ("EB", "MET", 50, (0, 100)),
+    ("EE", "pt", 50, (20, 100)), ("EE", "eta", 50, (-3, 3)), ("EE", "Q", 3, (-1, 1)),
+    ("EE", "MET", 50, (0, 100)),
+    # Fig3, Fig4: ID variables before and after the N-1 cuts
+    ("EB", "sigmaEtaEta", 100, (0, 0.025)), ("cutEB1", "sigmaEtaEta", 100, (0, 0.025)),
+    ("EE", "sigmaEtaEta", 100, (0, 0.055)), ("cutEE1", "sigmaEtaEta", 100, (0, 0.055)),
+    ("EB", "HoverE", 100, (0, 0.15)), ("cutEB2", "HoverE", 100, (0, 0.15)),
+    ("EE", "HoverE", 100, (0, 0.15)), ("cutEE2", "HoverE", 100, (0, 0.15)),
+    ("EB", "iTpT", 100, (0, 0.5)), ("cutEB3", "iTpT", 100, (0, 0.5)),
+    ("EE", "iTpT", 100, (0, 0.5)), ("cutEE3", "iTpT", 100, (0, 0.5)),
+    ("EB", "iEpT", 100, (0, 0.5)), ("cutEB4", "iEpT", 100, (0, 0.5)),
+    ("EE", "iEpT", 100, (0, 0.5)), ("cutEE4", "iEpT", 100, (0, 0.5)),
+    ("EB", "iHpT", 100, (0, 0.5)), ("cutEB5", "iHpT", 100, (0, 0.5)),
+    ("EE", "iHpT", 100, (0, 0.5)), ("cutEE5", "iHpT", 100, (0, 0.5)),
+    # Fig5, Fig6: before and after all the cuts
+    ("EB", "pt", 170, None), ("EBcut", "pt", 125, None), ("EB", "pt", 50, None),
+    ("EBcut", "pt", 50, None), ("EB", "eta", 50, None), ("EBcut", "eta", 50, None), ("EB", "MET", 50, (-1.5, 1.5)),
+    ("EB", "MET", 150, None), ("EBcut", "MET", 150, None), ("EB", "MET", 50, None),
+    ("EBcut", "MET", 50, None), ("EB", "mt", 125, None), ("EBcut", "mt", 85, None),
+    ("EB", "mt", 50, None), ("EBcut", "mt", 50, None),
+    ("EE", "pt", 150, None), ("EEcut", "pt", 150, None), ("EE", "pt", 80, None),
+    ("EEcut", "pt", 80, None), ("EE", "eta", 50, None), ("EEcut", "eta", 50, None), ("EE", "MET", 100, None),
+    ("EEcut", "MET", 100, None), ("EE", "MET", 50, None), ("EEcut", "MET", 50, None),
+    ("EE", "mt", 125, None), ("EEcut", "mt", 125, None), ("EE", "mt", 85, None),
+    ("EEcut", "mt", 85, None),
+    # Fig7, Fig8, Fig9, Fig91: accepted events against the (rescaled) background
+    ("EBcut", "MET", 120, None), ("EBcut", "MET", 100, None), ("EBcut", "mt", 100, None),
+    ("EBbg", "MET", 100, None), ("EBbg", "mt", 100, None),
+    ("EEcut", "MET", 120, None), ("EEcut", "MET", 100, None), ("EEcut", "mt", 190, None),
+    ("EEcut", "mt", 160, None), ("EEbg", "MET", 100, None), ("EEbg", "mt", 100, None),
+]
+
+
+def fill_histograms(events, bits, histograms=HISTOGRAMS):
+    """
+    events: all the events (one shared table, no copies of the subsets)
+    bits: their cut bitmask, the samples ("EB", "EBcut", "cutEE1", ...) are selected from it
+    """
+    hists = {}
+    # one sample mask at a time
+    for sample in dict.fromkeys(key[0] for key in histograms):
+        mask = sample_mask(bits, sample)
+        for key in histograms:
+            if key[0] == sample and key not in hists:
+                _, var, bins, range = key
+                hists[key] = Hist.of(np.asarray(events[var])[mask], bins, range)
+    return hists
+
+
+def _labels(xlabel, log=False):
+    plt.xlabel(xlabel, fontsize = 15)
+    plt.ylabel("events", fontsize = 15)
+    if log:
+        plt.yscale('log')
+
+
+def fig1(h, factors=None):
+    # distributions in the EB region
+    plt.figure(figsize = (10,15))
+    plt.subplot(3, 2, 2)
+    h[("EB", "eta", 50, (-1.5, 1.5))].draw()
+    _labels("eta")
+    plt.ylim(0, 2000)
+    plt.subplot(3, 2, 1)
+    h[("EB", "pt", 50, (20, 100))].draw()
+    _labels("electron pt [GeV]")
+    plt.ylim(0, 5000)
+    plt.subplot(3, 2, 3)
+    h[("EB", "Q", 3, (-1, 1))].draw()
+    _labels("charge")
+    plt.ylim(0, 30000)
+    plt.xticks([-1, 0, 1])
+    plt.subplot(3, 2, 4)
+    h[("EB", "MET", 50, (0, 100))].draw()
+    _labels("MET [GeV]")
+    plt.ylim(0, 4000)
+
+
+def fig2(h, factors=None):
+    # distributions in the EE region
+    plt.figure(figsize = (10,15))
+    plt.subplot(3, 2, 1)
+    h[("EE", "pt", 50, (20, 100))].draw()
+    _labels("electron pt [GeV]")
+    plt.ylim(0, 5000)
+    plt.subplot(3, 2, 2)
+    h[("EE", "eta", 50, (-3, 3))].draw()
+    _labels("eta")
+    plt.ylim(0, 4000)
+    plt.subplot(3, 2, 3)
+    h[("EE", "Q", 3, (-1, 1))].draw()
+    _labels("charge")
+    plt.ylim(0, 30000)
+    plt.xticks([-1, 0, 1])
+    plt.subplot(3, 2, 4)
+    h[("EE", "MET", 50, (0, 100))].draw()
+    _labels("MET [GeV]")
+    plt.ylim(0, 4000)
+
+
+def _n_minus_one(h, pos, region, n, var, range, xlabel, ylim):
+    # distribution of var before and after the cuts on all the other variables
+    plt.subplot(3, 2, pos)
+    h[(region, var, 100, range)].draw()
+    h[("cut{}{}".format(region, n), var, 100, range)].draw()
+    _labels(xlabel, log=True)
+    # a log axis starts at one event
+    plt.ylim(1, ylim)
+
+
+def fig3(h, factors=None):
+    plt.figure(figsize = (10,15))
+    _n_minus_one(h, 1, "EB", 1, "sigmaEtaEta", (0, 0.025), "sigmaEtaEta", 10000)
+    _n_minus_one(h, 2, "EE", 1, "sigmaEtaEta", (0, 0.055), "sigmaEtaEta", 10000)
+    _n_minus_one(h, 3, "EB", 2, "HoverE", (0, 0.15), "HoverE", 1000)
+    _n_minus_one(h, 4, "EE", 2, "HoverE", (0, 0.15), "HoverE", 10000)
+
+
+def fig4(h, factors=None):
+    plt.figure(figsize = (10,15))
+    _n_minus_one(h, 1, "EB", 3, "iTpT", (0, 0.5), "IsoTrack/pt", 10000)
+    _n_minus_one(h, 2, "EE", 3, "iTpT", (0, 0.5), "IsoTrack/pt", 10000)
+    _n_minus_one(h, 3, "EB", 4, "iEpT", (0, 0.5), "IsoEcal/pt", 10000)
+    _n_minus_one(h, 4, "EE", 4, "iEpT", (0, 0.5), "IsoEcal/pt", 10000)
+    _n_minus_one(h, 5, "EB", 5, "iHpT", (0, 0.5), "IsoHcal/pt", 10000)
+    _n_minus_one(h, 6, "EE", 5, "iHpT", (0, 0.5), "IsoHcal/pt", 10000)
+
+
+def _before_after(h, pos, region, var, bins, xlabel, log=False, xlim=None):
+    # distribution of var in the region before and after all the cuts
+    plt.subplot(4, 2, pos)
+    if xlim:
+        plt.xlim(*xlim)
+    h[(region, var, bins[0], None)].draw()
+    h[(region + "cut", var, bins[1], None)].draw()
+    _labels(xlabel, log)
+
+
+def fig5(h, factors=None):
+    # before and after distributions for the EB region
+    plt.figure(figsize = (10,15))
+    _before_after(h, 1, "EB", "pt", (170, 125), "pt [GeV]", xlim=(0, 200))
+    _before_after(h, 2, "EB", "pt", (50, 50), "pt [GeV]", log=True)
+    _before_after(h, 3, "EB", "eta", (50, 50), "eta")
+    _before_after(h, 4, "EB", "eta", (50, 50), "eta", log=True)
+    h[("EB", "MET", 50, (-1.5, 1.5))].draw()
+    _before_after(h, 5, "EB", "MET", (150, 150), "MET [GeV]", xlim=(0, 100))
+    _before_after(h, 6, "EB", "MET", (50, 50), "MET [GeV]", log=True)
+    _before_after(h, 7, "EB", "mt", (125, 85), "mt [GeV]", xlim=(0, 200))
+    _before_after(h, 8, "EB", "mt", (50, 50), "mt [GeV]", log=True)
+
+
+def fig6(h, factors=None):
+    # before and after distributions for the EE region
+    plt.figure(figsize = (10,15))
+    _before_after(h, 1, "EE", "pt", (150, 150), "pt [GeV]", xlim=(0, 200))
+    _before_after(h, 2, "EE", "pt", (80, 80), "pt [GeV]", log=True, xlim=(0, 400))
+    _before_after(h, 3, "EE", "eta", (50, 50), "eta")
+    _before_after(h, 4, "EE", "eta", (50, 50), "eta", log=True)
+    _before_after(h, 5, "EE", "MET", (100, 100), "MET [GeV]", xlim=(0, 100))
+    _before_after(h, 6, "EE", "MET", (50, 50), "MET [GeV]", log=True)
+    _before_after(h, 7, "EE", "mt", (125, 125), "mt [GeV]", xlim=(0, 200))
+    _before_after(h, 8, "EE", "mt", (85, 85), "mt [GeV]", log=True, xlim=(0, 300))
+
+
+def _overlay(h, pos, hists, xlabel, xlim, ylim=None, log=False):
+    # accepted events and the background scaled by its factor
+    plt.subplot(2, 2, pos)
+    plt.xlim(*xlim)
+    for key, factor in hists:
+        h[key].scale(factor).draw()
+    _labels(xlabel, log)
+    if ylim:
+        # a log axis starts at one event
+        plt.ylim(max(ylim[0], 1) if log else ylim[0], ylim[1])
+
+
+def fig7(h, factors=None):
+    # distributions of background against all the events: scaling the background distribution so that
+    # its MET extremes overlap with the overall distribution (EB)
+    factor = (factors or BG_FACTORS)["EB"]
+    plt.figure(figsize = (10,10))
+    _overlay(h, 1, [(("EBcut", "MET", 120, None), 1), (("EBbg", "MET", 100, None), factor["MET"])],
+             "MET [GeV]", (0, 100))
+    _overlay(h, 2, [(("EBcut", "MET", 100, None), 1), (("EBbg", "MET", 100, None), factor["MET"])],
+             "MET [GeV]", (0, 200), (0, 10000), log=True)
+    _overlay(h, 3, [(("EBcut", "mt", 100, None), 1), (("EBbg", "mt", 100, None), factor["mt"])],
+             "mt [GeV]", (0, 150))
+    _overlay(h, 4, [(("EBcut", "mt", 100, None), 1), (("EBbg", "mt", 100, None), factor["mt"])],
+             "mt [GeV]", (0, 200), (0, 1000), log=True)
+
+
+def fig8(h, factors=None):
+    # the same for EE
+    factor = (factors or BG_FACTORS)["EE"]
+    plt.figure(figsize = (10,10))
+    _overlay(h, 1, [(("EEcut", "MET", 120, None), 1), (("EEbg", "MET", 100, None), factor["MET"])],
+             "MET [GeV]", (0, 80))
+    _overlay(h, 2, [(("EEcut", "MET", 100, None), 1), (("EEbg", "MET", 100, None), factor["MET"])],
+             "MET [GeV]", (0, 100), (0, 10000), log=True)
+    _overlay(h, 3, [(("EEcut", "mt", 190, None), 1), (("EEbg", "mt", 100, None), factor["mt"])],
+             "mt [GeV]", (0, 150))
+    _overlay(h, 4, [(("EEcut", "mt", 160, None), 1), (("EEbg", "mt", 100, None), factor["mt"])],
+             "mt [GeV]", (0, 200), (0, 1000), log=True)
+
+
+def _rescaled(h, region, factor):
+    # plotting rescaled backgrounds
+    plt.figure(figsize = (10,10))
+    _overlay(h, 1, [((region + "bg", "MET", 100, None), factor["MET"])], "MET [GeV]", (0, 100))
+    _overlay(h, 2, [((region + "bg", "MET", 100, None), factor["MET"])], "MET [GeV]", (0, 200), log=True)
+    _overlay(h, 3, [((region + "bg", "mt", 100, None), factor["mt"])], "mt [GeV]", (0, 150))
+    _overlay(h, 4, [((region + "bg", "mt", 100, None), factor["mt"])], "mt [GeV]", (0, 200), log=True)
+
+
+def fig9(h, factors=None):
+    # the EB background as it is
+    _rescaled(h, "EB", {"MET": 1, "mt": 1})
+
+
+def fig91(h, factors=None):
+    # the EE background, drawn with the hand-tuned EB factors as in the original analysis unless fitted
+    # EE factors are given
+    _rescaled(h, "EE", factors["EE"] if factors else {"MET": 0.22, "mt": 0.09})
+
+
+FIGURES = {"Fig1": fig1, "Fig2": fig2, "Fig3": fig3, "Fig4": fig4, "Fig5": fig5, "Fig6": fig6,
+           "Fig7": fig7, "Fig8": fig8, "Fig9": fig9, "Fig91": fig91}
+
+
+# headless batch rendering: every figure is drawn by the Agg backend in its own worker process,
+# the workers get the histograms once when they start
+_worker_hists = None
+_worker_factors = None
+
+
+def _init_worker(hists, factors):
+    global _worker_hists, _worker_factors
+    plt.switch_backend("Agg")
+    _worker_hists = hists
+    _worker_factors = factors
+
+
+def render(name, hists=None, fmt="png", dpi=None, outdir=".", show=False, factors=None):
+    """
+    Draws one figure and saves it as outdir/name.fmt, returns the path.
+    factors: background factors {region: {"MET": f, "mt": f}}, the hand-tuned ones if None
+    """
+    if hists is None:
+        hists, factors = _worker_hists, _worker_factors
+    FIGURES[name](hists, factors)
+    os.makedirs(outdir, exist_ok=True)
+    path = os.path.join(outdir, "{}.{}".format(name, fmt))
+    plt.savefig(path, dpi=dpi or "figure")
+    if show:
+        plt.show()
+    plt.close("all")
+    return path
+
+
+def render_all(hists, names=None, fmt="png", dpi=None, outdir=".", workers=None, factors=None):
+    """Renders the figures (all of them by default) in parallel worker processes without a GUI."""
+    names = names or list(FIGURES)
+    os.makedirs(outdir, exist_ok=True)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(hists, factors)) as pool:
+        futures = [pool.submit(render, name, None, fmt, dpi, outdir) for name in names]
+        return [f.result() for f in futures]
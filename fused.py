@@ -0,0 +1,114 @@
+import math
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from cube import N_CELLS, SHAPE, fill_cube
+from events import DERIVED, add_derived
+from selection import ALL_PASS, ANY_FAIL, ID_VARS, REGION, SIGNAL, SPEC, compile_selection, cut_bits
+
+# fused kernel: with numba installed, one parallel loop over the events computes iTpT, iEpT, iHpT and
+# mt, the region, the ID and signal region cuts (the bitmask of selection.cut_bits) and fills the
+# count cube of cube.py, without any temporary array of the events. Every thread fills its own copy
+# of the cube, the copies are added at the end. Without numba the same results come
+# from the numpy path (add_derived, cut_bits, fill_cube).
+# The derived variables are computed in the loop, so cos/sqrt may differ from numpy in the last bit and
+# an event exactly at a cut boundary may in principle move.
+# at least this many events per copy of the cube
+CHUNK_EVENTS = 1 << 16
+VALUES = ["sigmaEtaEta", "HoverE", "iTpT", "iEpT", "iHpT", "pt", "eta", "MET", "mt"]
+INPUTS = ["pt", "eta", "phi", "Q", "MET", "phiMET", "sigmaEtaEta", "HoverE", "isoTrack", "isoEcal", "isoHcal"]
+
+
+def _kernel(pt, eta, phi, Q, MET, phiMET, sigmaEtaEta, HoverE, isoTrack, isoEcal, isoHcal,
+            regions, pt_min, thresholds, signal_var, signal_low, bits, counts):
+    # regions: (2, 2) |eta| limits, thresholds: (2, 5) ID thresholds of EB and EE,
+    # signal_var/low: VALUES index and lower limit of the signal region cuts,
+    # counts: one row per chunk of events
+    n = len(pt)
+    chunks = counts.shape[0]
+    v = np.empty((chunks, 9))
+    for c in prange(chunks):
+        for i in range(c*n//chunks, (c + 1)*n//chunks):
+            x = v[c]
+            x[0], x[1] = sigmaEtaEta[i], HoverE[i]
+            x[2], x[3], x[4] = isoTrack[i]/pt[i], isoEcal[i]/pt[i], isoHcal[i]/pt[i]
+            x[5], x[6], x[7] = pt[i], eta[i], MET[i]
+            x[8] = math.sqrt(2*pt[i]*MET[i]*(1 - math.cos(phi[i] - phiMET[i])))
+            abs_eta = abs(eta[i])
+            region = -1
+            for r in range(2):
+                if abs_eta > regions[r, 0] and abs_eta < regions[r, 1] and pt[i] > pt_min:
+                    region = r
+            b = 0
+            if region >= 0:
+                b |= 1 << (10 + region)
+            signal = True
+            for k in range(len(signal_var)):
+                signal = signal and x[signal_var[k]] > signal_low[k]
+            if signal:
+                b |= SIGNAL
+            # the EE thresholds are used outside EB, as in selection.compile_selection
+            t = 0 if region == 0 else 1
+            for k in range(5):
+                if x[k] < thresholds[t, k]:
+                    b |= 1 << k
+                if x[k] > thresholds[t, k]:
+                    b |= 1 << (k + 5)
+            bits[i] = b
+            if region < 0:
+                continue
+            charge = 2 if Q[i] == 1 else (0 if Q[i] == -1 else 1)
+            cell = (((region*3 + charge)*32 + (b & ALL_PASS))*2 + (1 if b & ANY_FAIL else 0))*2 + \
+                (1 if b & SIGNAL else 0)
+            counts[c, cell] += 1
+
+
+if numba is not None:
+    prange = numba.prange
+    # the worker pools of main.py (figures, toys...) fork the process after the kernel has run, the
+    # parent then hangs at exit with the TBB threading layer; the workqueue layer is safe to fork
+    # (NUMBA_THREADING_LAYER still picks another one)
+    if "NUMBA_THREADING_LAYER" not in os.environ:
+        numba.config.THREADING_LAYER = "workqueue"
+    _kernel = numba.njit(parallel=True, cache=True)(_kernel)
+else:
+    prange = range
+
+
+def _limit(x, default):
+    return default if x is None else float(x)
+
+
+def fused_cube(events, spec=SPEC, working_point=None, chunks=None):
+    """
+    Cut bitmask and count cube of the events, the same as selection.cut_bits and cube.fill_cube,
+    from the fused kernel if numba is installed and the columns are float64 (derived columns not needed),
+    else from the numpy path.
+    chunks: number of ranges of events filled in parallel, each into its own copy of the cube
+            (default: one per numba thread, with at least CHUNK_EVENTS events each)
+    """
+    if numba is None or any(events[col].dtype != np.float64 for col in INPUTS if col != "Q"):
+        # float32 columns (--compact) are compared in float32 by numpy
+        if not set(DERIVED) <= set(events.columns):
+            add_derived(events)
+        bits = cut_bits(events, compile_selection(spec, working_point))
+        return bits, fill_cube(events, bits)
+    cuts = spec["working_points"][working_point or spec["working_point"]]
+    regions = np.array([[_limit(spec["regions"][r][0], -np.inf), _limit(spec["regions"][r][1], np.inf)]
+                        for r in REGION])
+    thresholds = np.array([[float(cuts[r].get(var, 1e300)) for var in ID_VARS] for r in REGION])
+    signal_var = np.array([VALUES.index(var) for var in spec["signal"]], dtype=np.intp)
+    signal_low = np.array([float(low) for low in spec["signal"].values()])
+    n = len(events)
+    chunks = chunks or max(1, min(numba.get_num_threads(), n//CHUNK_EVENTS))
+    bits = np.empty(n, dtype=np.uint16)
+    counts = np.zeros((chunks, N_CELLS), dtype=np.int64)
+    columns = [np.ascontiguousarray(events[col], dtype=np.float64) for col in INPUTS]
+    _kernel(*columns, regions, float(spec["pt_min"]), thresholds, signal_var, signal_low, bits, counts)
+    return bits, {"counts": counts.sum(axis=0).reshape(SHAPE)}
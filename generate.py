@@ -0,0 +1,80 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from events import COLUMNS
+
+# synthetic events with the schema of Wenu.csv, for testing and benchmarking at any size: a mixture
+# of W -> e nu decays (Jacobian peak in pt and mt, real MET, isolated electron-like showers) and
+# QCD background (falling pt, MET from the resolution only, wide showers and large isolation).
+# The events are made in chunks with their own random streams, so any size fits in memory and the
+# output only depends on the seed.
+RUNS = [146428, 146430, 146431, 146436, 146437, 146510, 146511, 146514, 146589, 146644]
+M_W, GAMMA_W = 80.4, 2.1
+SIGNAL_FRACTION = 0.5
+# background events with electron-like shower and isolation
+FAKE_FRACTION = 0.2
+CHUNK = 1_000_000
+
+
+def _chunk(rng, start, n, total, signal_fraction):
+    sig = rng.random(n) < signal_fraction
+    eb = rng.random(n) < 0.6
+    eta = np.where(eb, rng.uniform(-1.44, 1.44, n), rng.choice([-1, 1], n)*rng.uniform(1.57, 2.5, n))
+
+    # W at rest decaying into back-to-back electron and neutrino, plus a small recoil
+    m = np.clip(M_W + GAMMA_W/2*np.tan(np.pi*(rng.random(n) - 0.5)), 40, 200)
+    cos = rng.uniform(-1, 1, n)
+    pt_w = m/2*np.sqrt(1 - cos*cos)
+    pt = np.where(sig, pt_w*rng.normal(1, 0.03, n), 20 + rng.exponential(12, n))
+    phi = rng.uniform(-np.pi, np.pi, n)
+    met_x = np.where(sig, -pt_w*np.cos(phi), 0) + rng.normal(0, 6, n)
+    met_y = np.where(sig, -pt_w*np.sin(phi), 0) + rng.normal(0, 6, n)
+
+    # shower shape and isolation: narrow and isolated for electrons (also a part of the background,
+    # e.g. from heavy flavour decays), wide for the rest of the background
+    electron = sig | (rng.random(n) < FAKE_FRACTION)
+    see_eb = np.where(electron, rng.normal(0.0095, 0.001, n), rng.normal(0.012, 0.003, n))
+    see_ee = np.where(electron, rng.normal(0.027, 0.003, n), rng.normal(0.033, 0.006, n))
+    iso = np.where(electron, 0.02, 0.15)[:, None]*pt[:, None]*rng.exponential(1, (n, 3))
+
+    index = start + np.arange(n)
+    return pd.DataFrame({
+        "Run": np.asarray(RUNS)[index*len(RUNS)//total],
+        "Event": rng.integers(1, 2**31, n),
+        "pt": pt,
+        "eta": eta,
+        "phi": phi,
+        "Q": np.where(rng.random(n) < 0.58, 1, -1),
+        "MET": np.hypot(met_x, met_y),
+        "phiMET": np.arctan2(met_y, met_x),
+        "sigmaEtaEta": np.abs(np.where(eb, see_eb, see_ee)),
+        "HoverE": rng.exponential(1, n)*np.where(electron, 0.01, 0.05),
+        "isoTrack": iso[:, 0],
+        "isoEcal": iso[:, 1],
+        "isoHcal": iso[:, 2],
+    }, columns=COLUMNS)
+
+
+def generate(n, seed=0, signal_fraction=SIGNAL_FRACTION, chunk=CHUNK):
+    """Yields the n events as DataFrames of at most chunk events, sorted by run."""
+    sizes = [min(chunk, n - start) for start in range(0, n, chunk)]
+    for i, stream in enumerate(np.random.SeedSequence(seed).spawn(len(sizes))):
+        yield _chunk(np.random.default_rng(stream), i*chunk, sizes[i], n, signal_fraction)
+
+
+def write_csv(path, n, seed=0, signal_fraction=SIGNAL_FRACTION, chunk=CHUNK):
+    """Writes n synthetic events to a csv with the columns of Wenu.csv."""
+    for i, df in enumerate(generate(n, seed, signal_fraction, chunk)):
+        df.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="synthetic events with the columns of Wenu.csv")
+    parser.add_argument("events", type=float, help="number of events (1e6 is fine)")
+    parser.add_argument("output", help="csv file to write")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--signal-fraction", type=float, default=SIGNAL_FRACTION)
+    args = parser.parse_args()
+    write_csv(args.output, int(args.events), args.seed, args.signal_fraction)
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class Hist:
+    """
+    Histogram with uniform bins: bin edges, counts (sum of weights) and sum of weights squared.
+    It is filled once from the events and then merged, scaled and drawn without the raw events.
+    """
+
+    def __init__(self, edges, counts=None, sumw2=None):
+        self.edges = np.asarray(edges, dtype=float)
+        n = len(self.edges) - 1
+        self.counts = np.zeros(n) if counts is None else np.asarray(counts, dtype=float)
+        self.sumw2 = self.counts.copy() if sumw2 is None else np.asarray(sumw2, dtype=float)
+
+    @classmethod
+    def of(cls, values, bins, range=None, weights=None):
+        """Fills a new histogram, with the range of the values if no range is given (like np.histogram)."""
+        values = np.asarray(values)
+        if range is None:
+            low, high = (values.min(), values.max()) if len(values) else (0., 1.)
+            if low == high:
+                low, high = low - 0.5, high + 0.5
+        else:
+            low, high = range
+        return cls(np.linspace(low, high, bins + 1)).fill(values, weights)
+
+    @property
+    def bins(self):
+        return len(self.counts)
+
+    @property
+    def errors(self):
+        return np.sqrt(self.sumw2)
+
+    def index(self, values):
+        """Mask of the values inside the range and their bin numbers (same bins as np.histogram)."""
+        values = np.asarray(values)
+        low, high = self.edges[0], self.edges[-1]
+        keep = (values >= low) & (values <= high)
+        values = values[keep]
+        idx = ((values - low)*(self.bins/(high - low))).astype(np.intp)
+        idx[idx == self.bins] -= 1
+        # fix the rounding at the bin edges
+        idx[values < self.edges[idx]] -= 1
+        idx[(values >= self.edges[idx + 1]) & (idx != self.bins - 1)] += 1
+        return keep, idx
+
+    def fill(self, values, weights=None):
+        """Adds values into the histogram with one np.bincount (same bin assignment as np.histogram)."""
+        keep, idx = self.index(values)
+        if weights is None:
+            counts = np.bincount(idx, minlength=self.bins)
+            self.counts += counts
+            self.sumw2 += counts
+        else:
+            weights = np.asarray(weights, dtype=float)[keep]
+            self.counts += np.bincount(idx, weights, minlength=self.bins)
+            self.sumw2 += np.bincount(idx, weights*weights, minlength=self.bins)
+        return self
+
+    def _check(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("histograms with different binning cannot be merged")
+
+    def __add__(self, other):
+        self._check(other)
+        return Hist(self.edges, self.counts + other.counts, self.sumw2 + other.sumw2)
+
+    def __iadd__(self, other):
+        self._check(other)
+        self.counts += other.counts
+        self.sumw2 += other.sumw2
+        return self
+
+    def scale(self, factor):
+        """Histogram with every weight multiplied by factor (e.g. the background normalisation)."""
+        return Hist(self.edges, self.counts*factor, self.sumw2*factor*factor)
+
+    def draw(self, ax=None, **kwargs):
+        import matplotlib.pyplot as plt
+        return (ax or plt.gca()).stairs(self.counts, self.edges, fill=True, **kwargs)
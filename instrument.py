@@ -0,0 +1,174 @@
+import atexit
+import cProfile
+import csv
+import json
+import os
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# instrumentation of the pipeline stages: with --profile (or the WENU_PROFILE environment variable,
+# "1" or the path of the report) every `with stage(name, events):` block records its wall and CPU
+# time, events per second, the peak RSS and the bytes allocated (tracemalloc). Blocks with the same
+# name (e.g. the chunks of --stream) are added up. When it is off, stage() returns one shared object
+# doing nothing. capture="cprofile" or "tracemalloc" additionally writes a profile / the top
+# allocations of every stage next to the report.
+ENABLED = False
+REPORT = None
+CAPTURE = None
+RECORDS = {}
+_depth = 0
+
+
+class _Off:
+    events = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_OFF = _Off()
+
+
+def _rss_mb(who):
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss/1024
+
+
+class _Stage:
+    def __init__(self, name, events, subprocesses):
+        self.name, self.events, self.subprocesses = name, events, subprocesses
+
+    def __enter__(self):
+        global _depth
+        self.depth = _depth
+        _depth += 1
+        # forked workers would inherit the tracing and run several times slower
+        self.stopped = self.subprocesses and tracemalloc.is_tracing()
+        if self.stopped:
+            tracemalloc.stop()
+        self.traced = tracemalloc.is_tracing()
+        if self.traced:
+            tracemalloc.reset_peak()
+            self.allocated = tracemalloc.get_traced_memory()[0]
+        if CAPTURE == "cprofile" and self.depth == 0:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        global _depth
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        _depth -= 1
+        allocated = None
+        if self.traced:
+            allocated = tracemalloc.get_traced_memory()[1] - self.allocated
+            if CAPTURE == "tracemalloc":
+                _write_top(self.name, tracemalloc.take_snapshot())
+        if self.stopped:
+            tracemalloc.start()
+        if getattr(self, "profile", None) is not None:
+            self.profile.disable()
+            self.profile.dump_stats(_capture_path(self.name, ".prof"))
+        r = RECORDS.setdefault(self.name, {"calls": 0, "depth": self.depth, "wall": 0., "cpu": 0.,
+                                           "events": 0, "rss_mb": None, "children_rss_mb": None,
+                                           "allocated_mb": None})
+        r["calls"] += 1
+        r["wall"] += wall
+        r["cpu"] += cpu
+        r["events"] += int(self.events or 0)
+        r["rss_mb"] = _rss_mb(resource.RUSAGE_SELF) if resource else None
+        if self.subprocesses and resource:
+            r["children_rss_mb"] = _rss_mb(resource.RUSAGE_CHILDREN)
+        if allocated is not None:
+            r["allocated_mb"] = max(r["allocated_mb"] or 0, allocated/2**20)
+        return False
+
+
+def stage(name, events=None, subprocesses=False):
+    """
+    Context manager timing one stage of the pipeline (a no-op unless enabled).
+    events: number of events processed (can also be set on the returned object inside the block)
+    subprocesses: the stage runs worker processes, the allocations are not traced during it
+    """
+    if not ENABLED:
+        return _OFF
+    return _Stage(name, events, subprocesses)
+
+
+def _capture_path(name, ext):
+    base = os.path.splitext(REPORT)[0]
+    return "{}-{}{}".format(base, name.replace(" ", "_").replace("/", "_"), ext)
+
+
+def _write_top(name, snapshot, n=15):
+    with open(_capture_path(name, ".tracemalloc.txt"), "a") as f:
+        for stat in snapshot.statistics("lineno")[:n]:
+            f.write(str(stat) + "\n")
+        f.write("\n")
+
+
+def enable(report="profile.json", capture=None):
+    """Switches the instrumentation on, the report is written (and printed) when the program exits."""
+    global ENABLED, REPORT, CAPTURE
+    if not ENABLED:
+        tracemalloc.start()
+        atexit.register(write_report)
+    ENABLED, REPORT, CAPTURE = True, report, capture
+
+
+def rows():
+    out = []
+    for name, r in RECORDS.items():
+        row = dict(r, stage=name)
+        row["events_per_s"] = r["events"]/r["wall"] if r["events"] and r["wall"] else None
+        out.append(row)
+    return out
+
+
+def _fmt(x, spec):
+    return "-" if x is None else format(x, spec)
+
+
+def print_report():
+    print("{:<28}{:>6}{:>10}{:>10}{:>14}{:>10}{:>12}".format(
+        "stage", "calls", "wall [s]", "cpu [s]", "events/s", "RSS [MB]", "alloc [MB]"))
+    for row in rows():
+        print("{:<28}{:>6}{:>10.3f}{:>10.3f}{:>14}{:>10}{:>12}".format(
+            "  "*row["depth"] + row["stage"], row["calls"], row["wall"], row["cpu"],
+            _fmt(row["events_per_s"], ".3g"), _fmt(row["rss_mb"], ".0f"), _fmt(row["allocated_mb"], ".1f")))
+
+
+def write_report(path=None):
+    """Writes the records to path (REPORT by default) as json or csv, and prints the table."""
+    path = path or REPORT
+    if not RECORDS:
+        return
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, ["stage", "calls", "depth", "wall", "cpu", "events", "events_per_s",
+                                        "rss_mb", "children_rss_mb", "allocated_mb"])
+            writer.writeheader()
+            writer.writerows(rows())
+    else:
+        with open(path, "w") as f:
+            json.dump(rows(), f, indent=1)
+    print_report()
+
+
+# switched on from the environment, e.g. WENU_PROFILE=report.csv WENU_PROFILE_CAPTURE=cprofile
+if os.environ.get("WENU_PROFILE", "") not in ("", "0"):
+    _env = os.environ["WENU_PROFILE"]
+    enable("profile.json" if _env == "1" else _env, os.environ.get("WENU_PROFILE_CAPTURE") or None)
@@ -1,18 +1,197 @@
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
-import math
-
-# loading the data from the CERN website
-url = "http://opendata.cern.ch/record/545/files/Wenu.csv"
-wenu = pd.read_csv(url)
-
-# adding iso variables
-wenu["iTpT"] = wenu["isoTrack"]/wenu["pt"]
-wenu["iEpT"] = wenu["isoEcal"]/wenu["pt"]
-wenu["iHpT"] = wenu["isoHcal"]/wenu["pt"]
-wenu["mt"] = np.sqrt(2 * wenu["pt"]* wenu["MET"]*(1 - np.cos( wenu['phi'] - wenu['phiMET'])))
-print(wenu.describe().to_string())
+import argparse
+import sys
+from collections import Counter
+
+from batch import load_samples, print_batch, run_batch, write_batch
+from bgfit import (FIT_HISTOGRAMS, central, fit_factors, fit_lookup, print_factors, xsec_errors,
+                   xsec_factors)
+from cache import CACHE_DIR, cache_path, fetch, load_wenu, read_manifest
+from chunkstore import read_index
+from cube import cube_count, fill_cube
+from cutindex import CutIndex
+from events import URL, bytes_per_event
+from figures import FIGURES, HISTOGRAMS, fill_histograms, render, render_all
+from fused import fused_cube
+from instrument import enable, stage
+from parallel import select_and_fill
+from pipeline import TARGETS, params_from, run
+from runs import load_lumi, lumi_shares, per_run, print_runs
+from scan import default_grids, print_scan, scan, write_working_points
+from selection import (SPEC, compile_selection, cut_bits, load_spec, pattern_counts, print_cutflow,
+                       sample_mask)
+from service import WORKERS, Analysis, serve
+from streaming import (CHUNKSIZE, load_state, print_summary, save_state, stream, stream_lookup,
+                       stream_store, update)
+from systematics import default_variations, load_variations, print_variations, vary
+from toys import print_toys, run_toys
+from xsection import BG_FACTOR, BG_FACTORS, LUMI, cross_section
+
+parser = argparse.ArgumentParser(description="W -> e nu cross section from the CMS open data")
+parser.add_argument("--source", default=URL, help="url or local path of Wenu.csv")
+parser.add_argument("--checksum", help="expected checksum of the downloaded csv (adler32:..., sha256:...)")
+parser.add_argument("--cache-dir", default=CACHE_DIR, help="directory of the local columnar cache")
+parser.add_argument("--offline", action="store_true", default=None,
+                    help="only use the local cache, fail if it is missing")
+parser.add_argument("--no-cache-derived", dest="cache_derived", action="store_false",
+                    help="do not store iTpT, iEpT, iHpT and mt in the cache")
+parser.add_argument("--verify-cache", action="store_true", help="check the cache checksums")
+parser.add_argument("--compact", action="store_true",
+                    help="keep the events as float32/int8 (events at a cut boundary may move)")
+parser.add_argument("--stream", action="store_true",
+                    help="read the csv in chunks and only print the counts (for data larger than RAM)")
+parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="events per chunk in --stream")
+parser.add_argument("--state", help="file with the accumulated --stream state: only the events not yet in it "
+                                    "are read, then it is saved again (local csv sources)")
+parser.add_argument("--runs", nargs=2, type=int, metavar=("FIRST", "LAST"),
+                    help="with --stream over a chunk store (chunkstore.py): only the runs FIRST to LAST (their "
+                         "luminosity from --lumi-table, or LUMI shared out by their number of events)")
+parser.add_argument("--selection", help="json/yaml file with the regions, cuts and working points")
+parser.add_argument("--working-point", help="working point of the selection spec to use")
+parser.add_argument("--samples", help="json/yaml file of samples (see batch.py): analyse them all, print "
+                                      "one table and stop")
+parser.add_argument("--batch-output", help="csv the results table of --samples is written to")
+parser.add_argument("--serve", nargs="?", type=int, const=8050, metavar="PORT",
+                    help="keep the events in memory and answer count/histogram/cross section queries on "
+                         "localhost (see service.py)")
+parser.add_argument("--index", action="store_true",
+                    help="with --serve: answer single-variable cut counts from sorted indexes kept in the cache")
+parser.add_argument("--per-run", action="store_true",
+                    help="print the acceptances, yields and cross section of every run and stop")
+parser.add_argument("--systematics", nargs="?", const="", metavar="FILE",
+                    help="cross section of every pt/MET scale and threshold variation (json/yaml list, a default "
+                         "set of about fifty if no file is given) and stop")
+parser.add_argument("--lumi-table", help="csv with the luminosity of every run (columns run,lumi)")
+parser.add_argument("--scan", action="store_true",
+                    help="scan the ID thresholds around the working point and print the best ones")
+parser.add_argument("--scan-top", type=int, default=10, help="number of working points printed by --scan")
+parser.add_argument("--scan-output", help="json spec the best working points of --scan are written to")
+parser.add_argument("--fit-background", action="store_true",
+                    help="fit the background factors in the MET/mt sidebands instead of the hand-tuned ones")
+parser.add_argument("--fit-method", choices=["poisson", "chi2"], default="poisson",
+                    help="binned likelihood or chi2 fit of the background factors")
+parser.add_argument("--toys", type=int, default=0,
+                    help="number of pseudo-experiments for the cross section uncertainty")
+parser.add_argument("--toy-mode", choices=["poisson", "bootstrap"], default="poisson",
+                    help="Poisson fluctuations of the counts or bootstrap resampling of the events")
+parser.add_argument("--seed", type=int, default=0, help="random seed of the pseudo-experiments")
+parser.add_argument("--headless", action="store_true",
+                    help="render the figures in parallel processes without a GUI (no plt.show())")
+parser.add_argument("--format", default="png", help="file format of the figures")
+parser.add_argument("--dpi", type=float, help="resolution of the figures")
+parser.add_argument("--figures-dir", default=".", help="directory of the figures")
+parser.add_argument("--jobs", type=int, help="worker processes (default: number of CPUs)")
+parser.add_argument("--parallel", action="store_true",
+                    help="evaluate the cuts and fill the histograms in worker processes over ranges of events")
+parser.add_argument("--target", nargs="+", choices=TARGETS + ["all"],
+                    help="only compute these results (sigma, figures), reusing the stored stage outputs")
+parser.add_argument("--profile", nargs="?", const="profile.json",
+                    help="time every stage and write the report (json or csv) at the end")
+parser.add_argument("--profile-capture", choices=["cprofile", "tracemalloc"],
+                    help="also write a cProfile profile / the top allocations of every stage")
+args = parser.parse_args()
+store = read_index(args.source)
+if store and args.state:
+    parser.error("--state needs a csv source, not a chunk store")
+if store and not args.stream:
+    parser.error("a chunk store source needs --stream")
+if args.runs and not (args.stream and store):
+    parser.error("--runs needs --stream over a chunk store")
+if args.profile:
+    enable(args.profile, args.profile_capture)
+
+# the regions, ID cuts and signal region are compiled from the spec into one bitmask expression
+spec = load_spec(args.selection) if args.selection else SPEC
+sel = compile_selection(spec, args.working_point)
+
+if args.target:
+    # stage graph: every intermediate result is stored under a hash of its inputs, code and
+    # parameters, only the stages that changed run again (see pipeline.py)
+    outputs, ran = run(TARGETS if "all" in args.target else args.target, params_from(args, spec))
+    print("Stages run: " + (", ".join(ran) or "none"))
+    for target, value in outputs.items():
+        if target == "sigma":
+            print("cs: ", value["sigma"], "nb +- ", value["sigmaerr"])
+        else:
+            print(target + ": " + value)
+    sys.exit()
+
+if args.samples:
+    # batch mode: the samples of one source share the loaded events and the evaluated cuts
+    with stage("batch", subprocesses=True):
+        results = run_batch(load_samples(args.samples), args.cache_dir, args.jobs, args.offline)
+    print_batch(results)
+    if args.batch_output:
+        write_batch(results, args.batch_output)
+    sys.exit()
+
+if args.stream or args.state:
+    # streaming mode: every chunk is added into counters and fixed-binning histograms, the
+    # acceptances, background estimate and cross section come out of the counters
+    source = args.source if store else fetch(args.source, cache_path(args.source, args.cache_dir), args.checksum)
+    with stage("stream"):
+        if store:
+            # chunk store: the chunks outside the regions (zone maps) are not read
+            state = stream_store(source, selection=sel, spec=spec, runs=args.runs)
+        elif args.state:
+            # incremental mode: the new runs (files, or lines appended to a file) are merged into the state
+            state, new = update(source, load_state(args.state), args.chunksize, sel)
+            save_state(state, args.state)
+            print("New events: {}, runs: {}, files: {}".format(new, len(state["runs"]),
+                                                              len(state["sources"])))
+        else:
+            state = stream(source, args.chunksize, selection=sel)
+    factor = None
+    factor_err = None
+    if args.fit_background:
+        with stage("background fit"):
+            fits = fit_factors(stream_lookup(state), method=args.fit_method)
+        print_factors(fits, BG_FACTORS)
+        factor = xsec_factors(fits)
+        factor_err = xsec_errors(fits)
+    lumi = LUMI
+    if args.runs:
+        # the luminosity of the selected runs: from --lumi-table, else their share of the rest of LUMI
+        events = Counter()
+        for chunk in store["chunks"]:
+            events[int(chunk["zones"]["Run"][0])] += chunk["rows"]
+        shares = lumi_shares(events, load_lumi(args.lumi_table) if args.lumi_table else None)
+        lumi = sum(shares[run] for run in state["runs"])
+    with stage("cross section"):
+        result = print_summary(state, factor, lumi)
+    if args.toys:
+        n = result["counts"]
+        with stage("toys", args.toys):
+            sigmas = run_toys({r: n[r + "scut"] for r in ("EB", "EE")},
+                              {r: n[r + "sbg"] for r in ("EB", "EE")}, args.toys,
+                              factor or BG_FACTOR, factor_err, args.toy_mode, args.seed, args.jobs or 1,
+                              state["counts"]["events"], lumi)
+        print_toys(sigmas)
+    sys.exit()
+
+# loading the data from the CERN website (only on the first run, later runs memory-map the local
+# cache) and adding the iso variables and the transverse mass
+with stage("load") as st:
+    wenu = load_wenu(args.source, args.cache_dir, offline=args.offline,
+                     derived=args.cache_derived, verify=args.verify_cache, checksum=args.checksum)
+    if args.compact:
+        # float32/int8 copy of the cache, memory-mapped the same way
+        before = bytes_per_event(wenu)
+        wenu = load_wenu(args.source, args.cache_dir, offline=args.offline,
+                         derived=args.cache_derived, verify=args.verify_cache, compact=True)
+        print("Bytes per event: {:.1f} -> {:.1f}".format(before, bytes_per_event(wenu)))
+    st.events = len(wenu)
+if args.serve:
+    index = None
+    if args.index:
+        # built lazily by the queries, kept next to the cache
+        path = cache_path(args.source, args.cache_dir, args.compact)
+        index = CutIndex(path, read_manifest(path), spec, wenu)
+    analysis = Analysis(wenu, spec, args.working_point, index)
+    analysis.patterns()
+    serve(analysis, args.serve, args.jobs or WORKERS)
+    sys.exit()
+with stage("describe", len(wenu)):
+    print(wenu.describe().to_string())
 print(wenu.head().to_string())
 # listing the columns (variables)
 print("Wenu variables: " + str(list(wenu.columns)))
@@ -21,847 +200,192 @@ print("\n")
 # number of accelerator runs from which the data was collected
 print(wenu["Run"].value_counts().to_frame())
 
+if args.per_run:
+    # the cache keeps the events grouped by run, every run is analysed in its own process
+    path = cache_path(args.source, args.cache_dir)
+    run_factor = BG_FACTOR
+    if args.fit_background:
+        # the background factors are fitted once on all the events, the runs are too small for a fit
+        with stage("background fit", len(wenu)):
+            fits = fit_factors(fit_lookup(fill_histograms(wenu, cut_bits(wenu, sel), FIT_HISTOGRAMS)),
+                               method=args.fit_method)
+        print_factors(fits, BG_FACTORS)
+        run_factor = xsec_factors(fits)
+    with stage("per run", len(wenu), subprocesses=True):
+        results = per_run(path, read_manifest(path), spec, sel["working_point"], run_factor,
+                          lumi=load_lumi(args.lumi_table) if args.lumi_table else None,
+                          workers=args.jobs)
+    print_runs(results)
+    sys.exit()
+
+if args.systematics is not None:
+    # all the variations in one pass, the derived variables are recomputed for every variation at once
+    variations = load_variations(args.systematics) if args.systematics else default_variations()
+    with stage("systematics", len(wenu)):
+        results = vary(wenu, variations, spec, sel["working_point"])
+    print_variations(results)
+    sys.exit()
 
 
-# histograms
-
 # using cuts on the eta and pt variables to differentiate between regions of the detector
 # EB = end barrel, EE = end cap
-EB = wenu[(abs(wenu.eta) < 1.44) & ( wenu.pt > 25)]
-EE = wenu[(abs(wenu.eta) > 1.57) & (abs(wenu.eta) < 2.5) & (wenu.pt > 25)]
-
-print(EB.describe().to_string())
-print(EE.describe().to_string())
-
-figEB = plt.figure(figsize = (10,15))
-
-plt.subplot(3, 2, 2)
-plt.hist(EB.eta, bins = 50, range = [-1.5, 1.5])
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 2000)
-
-plt.subplot(3, 2, 1)
-plt.hist(EB.pt, bins = 50, range = [20, 100])
-plt.xlabel("electron pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 5000)
-
-plt.subplot(3, 2, 3)
-plt.hist(EB.Q, bins = 3, range = [-1, 1])
-plt.xlabel("charge", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 30000)
-plt.xticks([-1, 0, 1])
-
-plt.subplot(3, 2, 4)
-plt.hist(EB.MET, bins = 50, range = [0, 100])
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 4000)
-plt.savefig('Fig1.png')
-plt.show()
-
-
-figEE = plt.figure(figsize = (10,15))
-
-plt.subplot(3, 2, 1)
-plt.hist(EE.pt, bins = 50, range = [20, 100])
-plt.xlabel("electron pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 5000)
-
-plt.subplot(3, 2, 2)
-plt.hist(EE.eta, bins = 50, range = [-3, 3])
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 4000)
-
-plt.subplot(3, 2, 3)
-plt.hist(EE.Q, bins = 3, range = [-1, 1])
-plt.xlabel("charge", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 30000)
-plt.xticks([-1, 0, 1])
-
-plt.subplot(3, 2, 4)
-plt.hist(EE.MET, bins = 50, range = [0, 100])
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.ylim(0, 4000)
-plt.savefig('Fig2.png')
-plt.show()
+# all the region, ID and signal region cuts are evaluated once per event and packed into a bitmask,
+# every selection below is a test of these bits (see selection.py)
+hists = None
+with stage("selection", len(wenu), subprocesses=args.parallel):
+    if args.parallel:
+        # the workers map the cache themselves, only the bitmask and the histograms come back
+        path = cache_path(args.source, args.cache_dir, args.compact)
+        bits, hists = select_and_fill(path, read_manifest(path), spec, sel["working_point"],
+                                      HISTOGRAMS + FIT_HISTOGRAMS, args.jobs)
+    else:
+        # with numba, the cuts and the cube below come from one fused loop over the events (see fused.py)
+        bits, cube = fused_cube(wenu, spec, sel["working_point"])
+    # the subsets are boolean masks over the one table of events, not copies of it
+    EB = sample_mask(bits, "EB")
+    EE = sample_mask(bits, "EE")
+# every count below is a sum over the cells of one count cube filled in one pass (see cube.py)
+if args.parallel:
+    with stage("cube", len(wenu)):
+        cube = fill_cube(wenu, bits)
+nEB = cube_count(cube, "EB")
+nEE = cube_count(cube, "EE")
+
+if args.scan:
+    # threshold scan: the figure of merit of every combination of ID thresholds from cumulative
+    # histograms of the ID variables
+    with stage("scan", nEB + nEE):
+        best = scan(wenu, bits, default_grids(sel["cuts"]), args.scan_top)
+    print_scan(best)
+    if args.scan_output:
+        write_working_points(best, spec, args.scan_output)
+    sys.exit()
+
+# (column by column, so that no copy of the region is made)
+with stage("describe", nEB + nEE):
+    print(wenu.apply(lambda col: col[EB].describe()).to_string())
+    print(wenu.apply(lambda col: col[EE].describe()).to_string())
 
 # identification variables: cuts on multiple variables to reduce background (mistakenly recorded events
 # from other decays)
 
-cutEB1 = EB[(EB.HoverE < 0.04) & (EB.iTpT < 0.09) & (EB.iEpT < 0.07) & (EB.iHpT < 0.1)]
-cutEB2 = EB[(EB.sigmaEtaEta < 0.01) & (EB.iTpT < 0.09) & (EB.iEpT < 0.07) & (EB.iHpT < 0.1)]
-cutEB3 = EB[(EB.sigmaEtaEta < 0.01) & (EB.HoverE < 0.04) & (EB.iEpT < 0.07) & (EB.iHpT < 0.1)]
-cutEB4 = EB[(EB.sigmaEtaEta < 0.01) & (EB.HoverE < 0.04) & (EB.iTpT < 0.09) & (EB.iHpT < 0.1)]
-cutEB5 = EB[(EB.sigmaEtaEta < 0.01) & (EB.HoverE < 0.04) & (EB.iEpT < 0.07) & (EB.iTpT < 0.09)]
-
-cutEE1 = EE[(EE.HoverE < 0.025) & (EE.iTpT < 0.05) & (EE.iEpT < 0.06) & (EE.iHpT < 0.025)]
-cutEE2 = EE[(EE.sigmaEtaEta < 0.031) & (EE.iTpT < 0.05) & (EE.iEpT < 0.06) & (EE.iHpT < 0.025)]
-cutEE3 = EE[(EE.sigmaEtaEta < 0.031) & (EE.HoverE < 0.025) & (EE.iEpT < 0.06) & (EE.iHpT < 0.025)]
-cutEE4 = EE[(EE.sigmaEtaEta < 0.031) & (EE.HoverE < 0.025) & (EE.iTpT < 0.05) & (EE.iHpT < 0.025)]
-cutEE5 = EE[(EE.sigmaEtaEta < 0.031) & (EE.HoverE < 0.025) & (EE.iTpT < 0.05) & (EE.iEpT < 0.06)]
-
-
-# histograms (comparing distributions of every variable before and after performing cuts
-# on all the other variables except for the one plotted (EB1/EE1, EB2/EE2...)
-
-figcuts1 = plt.figure(figsize = (10,15))
-
-plt.subplot(3, 2, 1)
-plt.hist(EB.sigmaEtaEta, bins = 100, range = (0, 0.025))
-plt.xlabel("sigmaEtaEta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 1)
-plt.hist(cutEB1.sigmaEtaEta, bins = 100, range = (0, 0.025))
-plt.xlabel("sigmaEtaEta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 2)
-plt.hist(EE.sigmaEtaEta, bins = 100, range = (0, 0.055))
-plt.xlabel("sigmaEtaEta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 2)
-plt.hist(cutEE1.sigmaEtaEta, bins = 100, range = (0, 0.055))
-plt.xlabel("sigmaEtaEta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-
-
-plt.subplot(3, 2, 3)
-plt.hist(EB.HoverE, bins = 100, range = (0, 0.15))
-plt.xlabel("HoverE", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 1000)
-
-plt.subplot(3, 2, 3)
-plt.hist(cutEB2.HoverE, bins = 100, range = (0, 0.15))
-plt.xlabel("HoverE", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 1000)
-
-plt.subplot(3, 2, 4)
-plt.hist(EE.HoverE, bins = 100, range = (0, 0.15))
-plt.xlabel("HoverE", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 4)
-plt.hist(cutEE2.HoverE, bins = 100, range = (0, 0.15))
-plt.xlabel("HoverE", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-plt.savefig('Fig3.png')
-plt.show()
-
-
-figcuts2 = plt.figure(figsize = (10,15))
-
-
-plt.subplot(3, 2, 1)
-plt.hist(EB.iTpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoTrack/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 1)
-plt.hist(cutEB3.iTpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoTrack/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 2)
-plt.hist(EE.iTpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoTrack/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 2)
-plt.hist(cutEE3.iTpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoTrack/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-
-
-plt.subplot(3, 2, 3)
-plt.hist(EB.iEpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoEcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 3)
-plt.hist(cutEB4.iEpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoEcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 4)
-plt.hist(EE.iEpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoEcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 4)
-plt.hist(cutEE4.iEpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoEcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-
-plt.subplot(3, 2, 5)
-plt.hist(EB.iHpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoHcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 5)
-plt.hist(cutEB5.iHpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoHcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 6)
-plt.hist(EE.iHpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoHcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-
-plt.subplot(3, 2, 6)
-plt.hist(cutEE5.iHpT, bins = 100, range = (0, 0.5))
-plt.xlabel("IsoHcal/pt", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-plt.ylim(0, 10000)
-plt.savefig('Fig4.png')
-plt.show()
+# N-1 selections: all the cuts except for the one on the n-th variable
+cutEB1, cutEB2, cutEB3, cutEB4, cutEB5 = [cube_count(cube, "cutEB{}".format(n)) for n in range(1, 6)]
+cutEE1, cutEE2, cutEE3, cutEE4, cutEE5 = [cube_count(cube, "cutEE{}".format(n)) for n in range(1, 6)]
 
+print_cutflow(pattern_counts(bits))
 
 # using all the cuts at once
-EBcut = EB[(EB.sigmaEtaEta < 0.01) & (EB.HoverE < 0.04) & (EB.iTpT < 0.09) & (EB.iEpT < 0.07) & (EB.iHpT < 0.1)]
-EEcut = EE[(EE.sigmaEtaEta < 0.031) & (EE.HoverE < 0.025) & (EE.iTpT < 0.05) & (EE.iEpT < 0.06) & (EE.iHpT < 0.025)]
+EBcut = cube_count(cube, "EBcut")
+EEcut = cube_count(cube, "EEcut")
 # the events outside of cut ranges are considered background events
-EBbg = EB[(EB.sigmaEtaEta > 0.01) | (EB.HoverE > 0.04) | (EB.iTpT > 0.09) | (EB.iEpT > 0.07) | (EB.iHpT > 0.1)]
-EEbg = EE[(EE.sigmaEtaEta > 0.031) | (EE.HoverE > 0.025) | (EE.iTpT > 0.05) | (EE.iEpT > 0.06) | (EE.iHpT > 0.025)]
-
-
-# before and after distributions for the EB region
-figfinal = plt.figure(figsize = (10,15))
-
-plt.subplot(4, 2, 1)
-plt.xlim(0,200)
-plt.hist(EB.pt, bins = 170)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 1)
-plt.xlim(0,200)
-plt.hist(EBcut.pt, bins = 125)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 2)
-plt.hist(EB.pt, bins = 50)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-plt.subplot(4, 2, 2)
-plt.hist(EBcut.pt, bins = 50)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-plt.subplot(4, 2, 3)
-plt.hist(EB.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 3)
-plt.hist(EBcut.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 4)
-plt.hist(EB.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.subplot(4, 2, 4)
-plt.hist(EBcut.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.subplot(4, 2, 4)
-plt.hist(EB.MET, bins = 50, range = [-1.5, 1.5])
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-
-plt.subplot(4, 2, 5)
-plt.xlim(0,100)
-plt.hist(EB.MET, bins = 150)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 5)
-plt.xlim(0,100)
-plt.hist(EBcut.MET, bins = 150)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 6)
-plt.hist(EB.MET, bins = 50)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.subplot(4, 2, 6)
-plt.hist(EBcut.MET, bins = 50)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-plt.subplot(4, 2, 7)
-plt.xlim(0,200)
-plt.hist(EB.mt, bins = 125)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 7)
-plt.xlim(0,200)
-plt.hist(EBcut.mt, bins = 85)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 8)
-plt.hist(EB.mt, bins = 50)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.subplot(4, 2, 8)
-plt.hist(EBcut.mt, bins = 50)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.savefig('Fig5.png')
-plt.show()
-
-
-# before and after distributions for the EE region
-
-figfinal2 = plt.figure(figsize = (10,15))
-
-plt.subplot(4, 2, 1)
-plt.xlim(0,200)
-plt.hist(EE.pt, bins = 150)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 1)
-plt.xlim(0,200)
-plt.hist(EEcut.pt, bins = 150)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 2)
-plt.xlim(0,400)
-plt.hist(EE.pt, bins = 80)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-plt.subplot(4, 2, 2)
-plt.xlim(0,400)
-plt.hist(EEcut.pt, bins = 80)
-plt.xlabel("pt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-
-plt.subplot(4, 2, 3)
-plt.hist(EE.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 3)
-plt.hist(EEcut.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 4)
-plt.hist(EE.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.subplot(4, 2, 4)
-plt.hist(EEcut.eta, bins = 50)
-plt.xlabel("eta", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-
-plt.subplot(4, 2, 5)
-plt.xlim(0,100)
-plt.hist(EE.MET, bins = 100)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 5)
-plt.xlim(0,100)
-plt.hist(EEcut.MET, bins = 100)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 6)
-plt.hist(EE.MET, bins = 50)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.subplot(4, 2, 6)
-plt.hist(EEcut.MET, bins = 50)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-
-plt.subplot(4, 2, 7)
-plt.xlim(0,200)
-plt.hist(EE.mt, bins = 125)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 7)
-plt.xlim(0,200)
-plt.hist(EEcut.mt, bins = 125)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-
-plt.subplot(4, 2, 8)
-plt.xlim(0,300)
-plt.hist(EE.mt, bins = 85)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.subplot(4, 2, 8)
-plt.xlim(0,300)
-plt.hist(EEcut.mt, bins = 85)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-
-plt.savefig('Fig6.png')
-plt.show()
-
+EBbg = cube_count(cube, "EBbg")
+EEbg = cube_count(cube, "EEbg")
 
 # acceptance: events after cuts / events before cuts
-print(len(EBcut))
-print(len(EEcut))
-print("Acceptance EB {:}".format(len(EBcut)/len(EB)))
-print("Acceptance EE: {:}".format(len(EEcut)/len(EE)))
+print(EBcut)
+print(EEcut)
+print("Acceptance EB {:}".format(EBcut/nEB))
+print("Acceptance EE: {:}".format(EEcut/nEE))
 
 # background acceptance
-print("Akceptancja całej reszty do cięć na odwrót EB {:}".format(len(EBbg)/len(EB)))
-print("Akceptancja całej reszty do cięć na odwrót EE {:}".format(len(EEbg)/len(EE)))
+print("Akceptancja całej reszty do cięć na odwrót EB {:}".format(EBbg/nEB))
+print("Akceptancja całej reszty do cięć na odwrót EE {:}".format(EEbg/nEE))
 
-
-# distributions of background against all the events: scaling the background distribution so that
-# its MET extremes overlap with the overall distribution (we assume the background shape is correct
-# but the extreme MET values should be all background) - we use the scaling factor to calculate
+# distributions of background against all the events (Fig7, Fig8): scaling the background distribution
+# so that its MET extremes overlap with the overall distribution (we assume the background shape is
+# correct but the extreme MET values should be all background) - we use the scaling factor to calculate
 # the number of background events
 
-# EB
-
-figfinalEBbg = plt.figure(figsize = (10,10))
-
-plt.subplot(2, 2, 1)
-plt.xlim(0, 100)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBcut.MET, bins=120)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 1)
-plt.xlim(0, 100)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.MET, bins=100)
-factor = 0.22
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 2)
-plt.xlim(0, 200)
-plt.ylim(0, 10000)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBcut.MET, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 2)
-plt.ylim(0, 10000)
-plt.xlim(0, 200)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.MET, bins=100)
-factor = 0.22
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-
-plt.subplot(2, 2, 3)
-plt.xlim(0, 150)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBcut.mt, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 3)
-plt.xlim(0, 150)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.mt, bins=100)
-factor = 0.09
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 4)
-plt.xlim(0, 200)
-plt.ylim(0, 1000)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBcut.mt, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 4)
-plt.xlim(0, 200)
-plt.ylim(0, 1000)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.mt, bins=100)
-factor = 0.09
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.savefig('Fig7.png')
-plt.show()
-
-# EE
-
-figfinalEEbg = plt.figure(figsize = (10,10))
-
-plt.subplot(2, 2, 1)
-plt.xlim(0, 80)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEcut.MET, bins=120)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 1)
-plt.xlim(0, 80)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.MET, bins=100)
-factor = 0.27
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 2)
-plt.xlim(0, 100)
-plt.ylim(0, 10000)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEcut.MET, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 2)
-plt.ylim(0, 10000)
-plt.xlim(0, 100)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.MET, bins=100)
-factor = 0.27
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-
-plt.subplot(2, 2, 3)
-plt.xlim(0, 150)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEcut.mt, bins=190)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 3)
-plt.xlim(0, 150)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.mt, bins=100)
-factor = 0.25
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 4)
-plt.xlim(0, 200)
-plt.ylim(0, 1000)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEcut.mt, bins=160)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 4)
-plt.xlim(0, 200)
-plt.ylim(0, 1000)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.mt, bins=100)
-factor = 0.25
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.savefig('Fig8.png')
-plt.show()
-
 # we remove the extreme MET and mt values from both background and accepted events
 
-EBscut = EBcut[(EBcut.mt > 50) & (EBcut.MET > 25)]
-EEscut = EEcut[(EEcut.mt > 50) & (EEcut.MET > 25)]
+EBscut = cube_count(cube, "EBscut")
+EEscut = cube_count(cube, "EEscut")
 
-EBsbg = EBbg[(EBbg.mt > 50) & (EBbg.MET > 25)]
-EEsbg = EEbg[(EEbg.mt > 50) & (EEbg.MET > 25)]
+EBsbg = cube_count(cube, "EBsbg")
+EEsbg = cube_count(cube, "EEsbg")
 
 
-print(len(EBscut))
-print(len(EEscut))
+print(EBscut)
+print(EEscut)
 
-print("Background after cuts EB:", len(EBsbg))
-print("EE: ", len(EEsbg))
+print("Background after cuts EB:", EBsbg)
+print("EE: ", EEsbg)
 
-print("EB events no background: ", len(EBscut) - math.ceil(len(EBsbg)*0.22))
-print("EE: ", len(EEscut) - math.ceil(len(EEsbg)*0.25))
+# histograms: every distribution is binned once, all the figures (and the background fit) use these
+# histograms and never touch the events again
+if hists is None:
+    with stage("histograms", len(wenu)):
+        hists = fill_histograms(wenu, bits, HISTOGRAMS + FIT_HISTOGRAMS)
+
+# the background factors are either the hand-tuned ones or fitted in the MET/mt sidebands
+factors = None
+bg_factor = BG_FACTOR
+bg_factor_err = None
+if args.fit_background:
+    with stage("background fit"):
+        fits = fit_factors(fit_lookup(hists), method=args.fit_method)
+    print_factors(fits, BG_FACTORS)
+    factors = central(fits)
+    bg_factor = xsec_factors(fits)
+    bg_factor_err = xsec_errors(fits)
 
 # calculating the cross section - calculating a few extra variables according to instructions from the article
-eps_av = (len(EBscut)*0.798+len(EEscut)*0.67)/(len(EBscut)+len(EEscut))
-print(eps_av)
+n_sig = {"EB": EBscut, "EE": EEscut}
+n_bg = {"EB": EBsbg, "EE": EEsbg}
+xs = cross_section(n_sig, n_bg, bg_factor)
+Neb, Nee = xs["N"]["EB"], xs["N"]["EE"]
 
-Neb = len(EBscut) - math.ceil(len(EBsbg)*0.22)
-Nee = len(EEscut) - math.ceil(len(EEsbg)*0.25)
+print("EB events no background: ", Neb)
+print("EE: ", Nee)
+
+eps_av = xs["eps_av"]
+print(eps_av)
 
 print(Neb, Nee)
 
-Np = Neb/0.4933/0.798 + Nee/0.4933/0.67
+Np = xs["Np"]
 
 print(Np)
 
-sigma = Np/36000
-sigmaerr = 234/36000
+sigma = xs["sigma"]
+sigmaerr = xs["sigmaerr"]
 
 print("cs: ", sigma, "nb +- ", sigmaerr)
+if args.toys:
+    # spread of the cross section in pseudo-experiments (statistics, background factors, efficiencies)
+    with stage("toys", args.toys):
+        sigmas = run_toys(n_sig, n_bg, args.toys, bg_factor, bg_factor_err, args.toy_mode, args.seed,
+                          args.jobs or 1, wenu.shape[0])
+    print_toys(sigmas)
 print("-----")
 
 # charge imbalance
-print(len(EB[EB.Q==1]), len(EB[EB.Q==-1]))
-print(len(EE[EE.Q==1]), len(EE[EE.Q==-1]))
+print(cube_count(cube, "EB", charge=1), cube_count(cube, "EB", charge=-1))
+print(cube_count(cube, "EE", charge=1), cube_count(cube, "EE", charge=-1))
 
 print("-----")
 
 # all the acceptances
-print(len(cutEB1)/len(EB))
-print(len(cutEB2)/len(EB))
-print(len(cutEB3)/len(EB))
-print(len(cutEB4)/len(EB))
-print(len(cutEB5)/len(EB))
-print(len(EBcut)/len(EB))
+print(cutEB1/nEB)
+print(cutEB2/nEB)
+print(cutEB3/nEB)
+print(cutEB4/nEB)
+print(cutEB5/nEB)
+print(EBcut/nEB)
 print("---")
-print(len(cutEE1)/len(EE))
-print(len(cutEE2)/len(EE))
-print(len(cutEE3)/len(EE))
-print(len(cutEE4)/len(EE))
-print(len(cutEE5)/len(EE))
-print(len(EEcut)/len(EE))
-
-# plotting rescaled backgrounds
-figfinalEBbg2 = plt.figure(figsize = (10,10))
-
-plt.subplot(2, 2, 1)
-plt.xlim(0, 100)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.MET, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 2)
-# plt.ylim(0, 10000)
-plt.xlim(0, 200)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.MET, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 3)
-plt.xlim(0, 150)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.mt, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 4)
-plt.xlim(0, 200)
-# plt.ylim(0, 1000)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EBbg.mt, bins=100)
-factor = 1
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.savefig('Fig9.png')
-plt.show()
-
-######################
-
-figfinalEEbg2 = plt.figure(figsize = (10,10))
-
-plt.subplot(2, 2, 1)
-plt.xlim(0, 100)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.MET, bins=100)
-factor = 0.22
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 2)
-# plt.ylim(0, 10000)
-plt.xlim(0, 200)
-plt.xlabel("MET [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.MET, bins=100)
-factor = 0.22
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 3)
-plt.xlim(0, 150)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.mt, bins=100)
-factor = 0.09
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.subplot(2, 2, 4)
-plt.xlim(0, 200)
-# plt.ylim(0, 1000)
-plt.xlabel("mt [GeV]", fontsize = 15)
-plt.ylabel("events", fontsize = 15)
-plt.yscale('log')
-np.random.seed(0)
-data = np.random.normal(50, 20, 10000)
-(counts, bins) = np.histogram(EEbg.mt, bins=100)
-factor = 0.09
-plt.hist(bins[:-1], bins, weights=factor*counts)
-
-plt.savefig('Fig91.png')
-plt.show()
+print(cutEE1/nEE)
+print(cutEE2/nEE)
+print(cutEE3/nEE)
+print(cutEE4/nEE)
+print(cutEE5/nEE)
+print(EEcut/nEE)
+
+if args.headless:
+    with stage("figures", subprocesses=True):
+        render_all(hists, fmt=args.format, dpi=args.dpi, outdir=args.figures_dir, workers=args.jobs,
+                   factors=factors)
+else:
+    for name in FIGURES:
+        with stage("figures"):
+            render(name, hists, args.format, args.dpi, args.figures_dir, show=True, factors=factors)
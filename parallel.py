@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cache import read_cache
+from events import DERIVED, add_derived
+from figures import HISTOGRAMS, fill_histograms
+from selection import compile_selection, cut_bits, sample_mask
+
+# multi-core selection and histogramming: the workers memory-map the columns of the cache (shared
+# page cache, no copies), each takes a range of events, writes its bitmask into one shared-memory
+# array and fills partial histograms, only the histograms come back to be added up.
+# Histograms without a fixed range (range None, from the minimum to the maximum like plt.hist) need
+# the extremes of all the events first, so there are two passes: cuts and extremes, then filling.
+BLOCK = 1 << 20
+
+
+def _events(path, manifest, rows):
+    df = read_cache(path, manifest, rows=rows)
+    if not set(DERIVED) <= set(df.columns):
+        add_derived(df)
+    return df
+
+
+def _shared_bits(name, n):
+    shm = shared_memory.SharedMemory(name)
+    return shm, np.ndarray((n,), dtype=np.uint16, buffer=shm.buf)
+
+
+def _select(path, manifest, rows, spec, working_point, shm_name, extremes):
+    """Evaluates the cuts of the events in rows, returns the extremes of the (sample, var) pairs."""
+    df = _events(path, manifest, rows)
+    bits = cut_bits(df, compile_selection(spec, working_point))
+    shm, shared = _shared_bits(shm_name, manifest["rows"])
+    shared[rows[0]:rows[1]] = bits
+    del shared
+    shm.close()
+    out = {}
+    for sample, var in extremes:
+        values = np.asarray(df[var])[sample_mask(bits, sample)]
+        out[(sample, var)] = (values.min(), values.max()) if len(values) else None
+    return out
+
+
+def _fill(path, manifest, rows, shm_name, histograms):
+    df = _events(path, manifest, rows)
+    shm, shared = _shared_bits(shm_name, manifest["rows"])
+    hists = fill_histograms(df, shared[rows[0]:rows[1]], histograms)
+    del shared
+    shm.close()
+    return hists
+
+
+def _range(extremes):
+    # the range np.histogram takes from the values
+    found = [e for e in extremes if e is not None]
+    if not found:
+        return 0., 1.
+    low, high = min(e[0] for e in found), max(e[1] for e in found)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return low, high
+
+
+def select_and_fill(path, manifest, spec, working_point=None, histograms=HISTOGRAMS, workers=None,
+                    block=BLOCK):
+    """
+    Cut bitmask of all the events of the cache in path and the histograms (as fill_histograms),
+    computed by worker processes over ranges of `block` events.
+    """
+    n = manifest["rows"]
+    ranges = [(start, min(start + block, n)) for start in range(0, n, block)]
+    extremes = sorted({(sample, var) for sample, var, bins, range in histograms if range is None})
+    shm = shared_memory.SharedMemory(create=True, size=max(2*n, 1))
+    try:
+        with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+            parts = list(pool.map(_select, *zip(*[(path, manifest, rows, spec, working_point, shm.name,
+                                                   extremes) for rows in ranges])))
+            ranges_of = {key: _range([p[key] for p in parts]) for key in extremes}
+            resolved = {key: key if key[3] is not None else key[:3] + (ranges_of[key[:2]],)
+                        for key in histograms}
+            partial = pool.map(_fill, *zip(*[(path, manifest, rows, shm.name, list(resolved.values()))
+                                             for rows in ranges]))
+            hists = {}
+            for part in partial:
+                for key, h in part.items():
+                    if key in hists:
+                        hists[key] += h
+                    else:
+                        hists[key] = h
+        bits = np.ndarray((n,), dtype=np.uint16, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return bits, {key: hists[resolved[key]] for key in histograms}
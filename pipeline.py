@@ -0,0 +1,184 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+import bgfit
+import figures
+import histograms
+import selection
+import xsection
+from cache import CACHE_DIR, cache_path, load_selected, load_wenu, read_manifest
+from events import add_derived
+from instrument import stage
+
+# the analysis as a graph of named stages with explicit inputs:
+#   events -> bits -> patterns -> sigma
+#                  -> hists -> factors -> sigma, figures
+# The output of every stage is stored on disk under a hash of the code of the stage, its parameters
+# and the hashes of its inputs, so a stage only runs again when one of them changed (e.g. editing an
+# axis limit in figures.fig7 only draws Fig7 again) and a single target only runs what it needs.
+# The events themselves are not stored: their hash is the checksums of the columnar cache, and only
+# the columns used by the stages of the events inside the regions are loaded.
+
+
+def _code_hash(*objects):
+    # source of the modules, classes and functions, repr of the constants (e.g. binnings)
+    h = hashlib.sha256()
+    for obj in objects:
+        code = inspect.isfunction(obj) or inspect.ismodule(obj) or inspect.isclass(obj)
+        h.update((inspect.getsource(obj) if code else repr(obj)).encode())
+    return h.hexdigest()
+
+
+def _key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def _columns(p):
+    # the columns of the cuts and of the histograms
+    columns = set(selection.compile_selection(p["spec"], p["working_point"])["columns"])
+    return sorted(columns | {key[1] for key in figures.HISTOGRAMS + bgfit.FIT_HISTOGRAMS})
+
+
+def _events(p):
+    return load_selected(p["source"], p["cache_dir"], _columns(p),
+                         selection.compile_preselection(p["spec"]), offline=p["offline"],
+                         derived=p["derived"], compact=p["compact"])
+
+
+def _events_key(p):
+    # the content of the cache (sha256 of every column); load_wenu makes it first if needed and remakes it
+    # when the source changed, so a stale cache never gives the key of the old events
+    load_wenu(p["source"], p["cache_dir"], offline=p["offline"], derived=p["derived"], compact=p["compact"])
+    manifest = read_manifest(cache_path(p["source"], p["cache_dir"], p["compact"]))
+    return _key("events", {col: meta["sha256"] for col, meta in manifest["columns"].items()},
+                _columns(p), selection.compile_preselection(p["spec"])["expr"],
+                _code_hash(add_derived, load_selected))
+
+
+def _bits(p, events):
+    return selection.cut_bits(events, selection.compile_selection(p["spec"], p["working_point"]))
+
+
+def _patterns(p, bits):
+    return selection.pattern_counts(bits)
+
+
+def _hists(p, events, bits):
+    return figures.fill_histograms(events, bits, figures.HISTOGRAMS + bgfit.FIT_HISTOGRAMS)
+
+
+def _factors(p, hists):
+    """Background factors: {"xsec": one per region for the cross section, "figures": per variable}."""
+    if not p["fit_background"]:
+        return {"fits": None, "xsec": xsection.BG_FACTOR, "figures": None}
+    fits = bgfit.fit_factors(bgfit.fit_lookup(hists), method=p["fit_method"])
+    return {"fits": fits, "xsec": bgfit.xsec_factors(fits), "figures": bgfit.central(fits)}
+
+
+def _sigma(p, patterns, factors):
+    n = {(r, s): selection.count(patterns, r, **kwargs) for r in selection.REGION
+         for s, kwargs in (("scut", {"cuts": "all", "signal": True}),
+                           ("sbg", {"background": True, "signal": True}))}
+    return xsection.cross_section({r: n[(r, "scut")] for r in selection.REGION},
+                                  {r: n[(r, "sbg")] for r in selection.REGION}, factors["xsec"])
+
+
+def _figure(name):
+    def draw(p, hists, factors=None):
+        figures.plt.switch_backend("Agg")
+        os.makedirs(p["figures_dir"], exist_ok=True)
+        return figures.render(name, hists, p["format"], p["dpi"], p["figures_dir"],
+                              factors=factors["figures"] if factors else None)
+    return draw
+
+
+def _helpers(module):
+    return [obj for attr, obj in vars(module).items()
+            if attr.startswith("_") and inspect.isfunction(obj) and obj.__module__ == module.__name__]
+
+
+# name: (function, inputs, parameters, code the output depends on)
+STAGES = {
+    "bits": (_bits, ["events"], ["spec", "working_point"], [selection]),
+    "patterns": (_patterns, ["bits"], [], [selection.pattern_counts]),
+    "hists": (_hists, ["events", "bits"], [], [histograms, figures.fill_histograms, selection,
+                                               figures.HISTOGRAMS, bgfit.FIT_HISTOGRAMS]),
+    "factors": (_factors, ["hists"], ["fit_background", "fit_method"], [bgfit, xsection]),
+    "sigma": (_sigma, ["patterns", "factors"], [], [_sigma, selection, xsection]),
+}
+# the figures drawn with the background factors, the others only need the histograms
+SCALED = {"Fig7", "Fig8", "Fig91"}
+for _name, _fig in figures.FIGURES.items():
+    STAGES[_name] = (_figure(_name), ["hists", "factors"] if _name in SCALED else ["hists"],
+                     ["format", "dpi", "figures_dir"], [_fig, figures.render, *_helpers(figures)])
+TARGETS = ["sigma", *figures.FIGURES]
+
+
+def params_from(args, spec):
+    """Parameters of the stages from the command line arguments of main.py."""
+    return {"source": args.source, "cache_dir": args.cache_dir, "offline": args.offline,
+            "derived": args.cache_derived, "compact": args.compact, "spec": spec,
+            "working_point": args.working_point, "fit_background": args.fit_background,
+            "fit_method": args.fit_method, "format": args.format, "dpi": args.dpi,
+            "figures_dir": args.figures_dir}
+
+
+class _Run:
+    # one evaluation of targets: the keys and outputs already resolved in it
+    def __init__(self, params, store):
+        self.params, self.store = params, store
+        self.keys, self.values, self.ran = {}, {}, []
+
+    def key(self, name):
+        if name not in self.keys:
+            if name == "events":
+                self.keys[name] = _events_key(self.params)
+            else:
+                fn, inputs, params, code = STAGES[name]
+                self.keys[name] = _key(name, _code_hash(*code), {k: self.params[k] for k in params},
+                                       [self.key(i) for i in inputs])
+        return self.keys[name]
+
+    def _file(self, name):
+        return os.path.join(self.store, "{}-{}.pkl".format(name, self.key(name)[:16]))
+
+    def value(self, name):
+        if name in self.values:
+            return self.values[name]
+        if name == "events":
+            with stage("events"):
+                value = _events(self.params)
+        else:
+            path = self._file(name)
+            fn, inputs, params, code = STAGES[name]
+            value = None
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+                # a figure is only up to date if its file is still there
+                if name in figures.FIGURES and not os.path.exists(value):
+                    value = None
+            if value is None:
+                args = [self.value(i) for i in inputs]
+                with stage(name):
+                    value = fn(self.params, *args)
+                self.ran.append(name)
+                os.makedirs(self.store, exist_ok=True)
+                with open(path + ".part", "wb") as f:
+                    pickle.dump(value, f)
+                os.replace(path + ".part", path)
+        self.values[name] = value
+        return value
+
+
+def run(targets, params, store=None):
+    """
+    Evaluates the targets ("sigma", "Fig1"...), running only the stages whose stored output is
+    missing or out of date. Returns ({target: output}, names of the stages that ran).
+    """
+    store = store or os.path.join(params.get("cache_dir") or CACHE_DIR, "stages")
+    r = _Run(params, store)
+    return {t: r.value(t) for t in targets}, r.ran
@@ -0,0 +1,89 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import read_cache
+from events import DERIVED, add_derived
+from selection import REGION, compile_selection, count, cut_bits, pattern_counts
+from xsection import BG_FACTOR, LUMI, cross_section
+
+# per-run analysis: the cache keeps the events grouped by run with the offsets of every run in the
+# manifest, so each run is a slice of the memory-mapped columns and the runs are analysed in
+# parallel worker processes that map the cache themselves
+
+
+def load_lumi(path):
+    """Integrated luminosity of every run (same units as xsection.LUMI) from a csv with run,lumi."""
+    with open(path) as f:
+        return {int(row["run"]): float(row["lumi"]) for row in csv.DictReader(f)}
+
+
+def lumi_shares(events, lumi=None):
+    """
+    Luminosity of every run of {run: number of events}: the value of the table lumi ({run: luminosity})
+    if it has one, the rest of LUMI shared out among the other runs by their number of events.
+    """
+    lumi = lumi or {}
+    missing = {run: n for run, n in events.items() if run not in lumi}
+    rest = max(LUMI - sum(lumi[run] for run in events if run in lumi), 0.0)
+    total = sum(missing.values())
+    return {run: lumi[run] if run in lumi else (rest*n/total if total else 0.0) for run, n in events.items()}
+
+
+def run_slices(manifest):
+    """{run: (start, stop)} rows of every run in the cache."""
+    index = manifest["run_index"]
+    offsets = index["offsets"]
+    return {run: (offsets[i], offsets[i + 1]) for i, run in enumerate(index["runs"])}
+
+
+def analyse_run(path, manifest, rows, spec, working_point, factor, lumi):
+    """Acceptances, background-subtracted yields and cross section of the events in rows."""
+    df = read_cache(path, manifest, rows=rows)
+    if not set(DERIVED) <= set(df.columns):
+        add_derived(df)
+    patterns = pattern_counts(cut_bits(df, compile_selection(spec, working_point)))
+    n = {}
+    for region in REGION:
+        n[region] = count(patterns, region)
+        n[region + "cut"] = count(patterns, region, "all")
+        n[region + "scut"] = count(patterns, region, "all", signal=True)
+        n[region + "sbg"] = count(patterns, region, background=True, signal=True)
+    result = cross_section({r: n[r + "scut"] for r in REGION}, {r: n[r + "sbg"] for r in REGION},
+                           factor, lumi=lumi)
+    result["events"] = rows[1] - rows[0]
+    result["counts"] = n
+    result["lumi"] = lumi
+    for region in REGION:
+        result["acceptance " + region] = n[region + "cut"]/n[region] if n[region] else float("nan")
+    return result
+
+
+def per_run(path, manifest, spec, working_point=None, factor=BG_FACTOR, lumi=None, workers=None):
+    """
+    Analyses every run of the cache in path in parallel, returns {run: result of analyse_run}.
+    lumi: {run: luminosity}; the runs without an entry share the rest of LUMI (see lumi_shares)
+    factor: background factor of each region, e.g. fitted on all the events
+    """
+    slices = run_slices(manifest)
+    lumi = lumi or {}
+    shares = lumi_shares({run: stop - start for run, (start, stop) in slices.items()}, lumi)
+    runs = list(slices)
+    args = [(path, manifest, slices[run], spec, working_point, factor, shares[run]) for run in runs]
+    with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        results = pool.map(analyse_run, *zip(*args))
+        out = dict(zip(runs, results))
+    for run in runs:
+        out[run]["lumi from table"] = run in lumi
+    return out
+
+
+def print_runs(results):
+    print("{:>8}{:>9}{:>9}{:>9}{:>8}{:>8}{:>11}{:>10}".format(
+        "run", "events", "acc EB", "acc EE", "N EB", "N EE", "lumi", "cs [nb]"))
+    for run, r in results.items():
+        print("{:>8}{:>9}{:>9.4f}{:>9.4f}{:>8}{:>8}{:>10.1f}{}{:>10.4f}".format(
+            run, r["events"], r["acceptance EB"], r["acceptance EE"], r["N"]["EB"], r["N"]["EE"],
+            r["lumi"], " " if r["lumi from table"] else "*", r["sigma"]))
+    if not all(r["lumi from table"] for r in results.values()):
+        print("* no luminosity in the table, the rest of LUMI shared out by the number of events")
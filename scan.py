@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+
+from selection import CUTS, ID_VARS, REGION, SIGNAL
+
+# scan of the ID thresholds: every ID variable is binned once on its grid of thresholds, the events
+# of a region go into a 5-dimensional histogram of these bins (one for the signal region and one for
+# the MET/mt sidebands) and its cumulative sums give the number of events passing every combination
+# of thresholds at once, so no grid point filters the events again
+# default grid: the article cuts times these factors (10**5 combinations per region)
+SCAN_STEPS = np.linspace(0.5, 2.0, 10)
+
+
+def default_grids(cuts=CUTS, steps=SCAN_STEPS):
+    """{region: {var: thresholds}} around the cuts of a working point."""
+    return {region: {var: cuts[region][var]*steps for var in ID_VARS} for region in REGION}
+
+
+def passing(values, grids, in_signal):
+    """
+    Number of events passing every combination of thresholds (var < threshold for all the ID
+    variables), in the signal region and in the sidebands, as arrays of shape (len(grid),)*5.
+    values: {var: values of the events in the region}, in_signal: mask of the signal region events
+    """
+    shape = tuple(len(grids[var]) + 1 for var in ID_VARS)
+    # index of the first threshold an event passes (len(grid) if it passes none)
+    idx = np.ravel_multi_index([np.searchsorted(grids[var], values[var], side="right")
+                                for var in ID_VARS], shape)
+    counts = []
+    for mask in (in_signal, ~in_signal):
+        n = np.bincount(idx[mask], minlength=int(np.prod(shape))).reshape(shape)
+        for axis in range(n.ndim):
+            n = np.cumsum(n, axis=axis)
+        counts.append(n[(slice(-1),)*n.ndim])
+    return counts
+
+
+def scan(events, bits, grids=None, top=10):
+    """
+    Ranks the threshold combinations of each region by the figure of merit S/sqrt(S + B), with S the
+    accepted events in the signal region and B the accepted events in the sidebands (background).
+    returns {region: list of the `top` best working points}
+    """
+    grids = grids or default_grids()
+    best = {}
+    for region in REGION:
+        in_region = (bits & REGION[region]) != 0
+        values = {var: np.asarray(events[var])[in_region] for var in ID_VARS}
+        in_signal = (bits[in_region] & SIGNAL) != 0
+        grid = {var: np.sort(np.asarray(grids[region][var], dtype=float)) for var in ID_VARS}
+        s, b = passing(values, grid, in_signal)
+        total = np.count_nonzero(in_region)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fom = np.where(s + b > 0, s/np.sqrt(s + b), 0)
+        order = np.argsort(-fom, axis=None, kind="stable")[:top]
+        best[region] = []
+        for flat in order:
+            k = np.unravel_index(flat, fom.shape)
+            accepted = int(s[k] + b[k])
+            best[region].append({
+                "cuts": {var: float(grid[var][i]) for var, i in zip(ID_VARS, k)},
+                "signal": int(s[k]), "sideband": int(b[k]), "fom": float(fom[k]),
+                "acceptance": accepted/total, "background acceptance": (total - accepted)/total,
+            })
+    return best
+
+
+def print_scan(best):
+    for region, points in best.items():
+        print("Best working points {}:".format(region))
+        print("{:>4}{:>10}{:>10}{:>9}{:>9}{:>9}  ".format("", "fom", "signal", "sideband", "acc", "bg acc")
+              + "".join("{:>13}".format(var) for var in ID_VARS))
+        for rank, p in enumerate(points, 1):
+            print("{:>4}{:>10.2f}{:>10}{:>9}{:>9.4f}{:>9.4f}  ".format(
+                rank, p["fom"], p["signal"], p["sideband"], p["acceptance"], p["background acceptance"])
+                + "".join("{:>13.4g}".format(p["cuts"][var]) for var in ID_VARS))
+
+
+def write_working_points(best, spec, path):
+    """Writes spec with the best points added as working points "scan1", "scan2"... (for --selection)."""
+    spec = dict(spec, working_points=dict(spec["working_points"]))
+    for rank in range(min(len(points) for points in best.values())):
+        spec["working_points"]["scan{}".format(rank + 1)] = {region: best[region][rank]["cuts"]
+                                                             for region in best}
+    with open(path, "w") as f:
+        json.dump(spec, f, indent=2)
@@ -0,0 +1,211 @@
+import json
+import os
+
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# the selection is defined declaratively: detector regions (EB = end barrel, EE = end cap),
+# the signal region and the upper limits of the ID variables for every working point.
+# A spec can also be read from a json/yaml file (load_spec), so retuning the cuts or adding a
+# working point does not touch the code.
+ID_VARS = ["sigmaEtaEta", "HoverE", "iTpT", "iEpT", "iHpT"]
+SPEC = {
+    "pt_min": 25,
+    # |eta| ranges of the regions, None = no limit
+    "regions": {"EB": [None, 1.44], "EE": [1.57, 2.5]},
+    # signal region: we remove the extreme MET and mt values (lower limits)
+    "signal": {"mt": 50, "MET": 25},
+    "working_point": "article",
+    "working_points": {
+        # the ID cuts of the CMS article
+        "article": {
+            "EB": {"sigmaEtaEta": 0.01, "HoverE": 0.04, "iTpT": 0.09, "iEpT": 0.07, "iHpT": 0.1},
+            "EE": {"sigmaEtaEta": 0.031, "HoverE": 0.025, "iTpT": 0.05, "iEpT": 0.06, "iHpT": 0.025},
+        },
+    },
+}
+CUTS = SPEC["working_points"][SPEC["working_point"]]
+
+# cut-flow engine: every cut is evaluated once per event and the results are packed into one
+# uint16 per event, all the selections of the analysis are then cheap tests of these bits
+PASS = {var: 1 << i for i, var in enumerate(ID_VARS)}       # var < cut
+FAIL = {var: 1 << (i + 5) for i, var in enumerate(ID_VARS)}  # var > cut (background)
+REGION = {"EB": 1 << 10, "EE": 1 << 11}
+SIGNAL = 1 << 12                                             # mt > 50 and MET > 25
+ALL_PASS = sum(PASS.values())
+ANY_FAIL = sum(FAIL.values())
+
+# events per block of the numpy kernel, small enough for the temporaries to stay in the cache
+BLOCK = 1 << 16
+
+
+def load_spec(path):
+    """Reads a selection spec (same layout as SPEC) from a json or yaml file."""
+    with open(path) as f:
+        if os.path.splitext(path)[1] in (".yaml", ".yml"):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _num(x):
+    # thresholds go into the generated expression as plain float literals
+    return repr(float(x))
+
+
+def _range(var, limits):
+    low, high = limits
+    terms = []
+    if low is not None:
+        terms.append("({} > {})".format(var, _num(low)))
+    if high is not None:
+        terms.append("({} < {})".format(var, _num(high)))
+    return " & ".join(terms)
+
+
+def compile_selection(spec=SPEC, working_point=None):
+    """
+    Compiles the spec (for one working point, the spec default if None) into a single expression
+    giving the bitmask of every event, evaluated by numexpr if available or by numpy in blocks.
+    """
+    working_point = working_point or spec["working_point"]
+    cuts = spec["working_points"][working_point]
+    pt = "(pt > {})".format(_num(spec["pt_min"]))
+    region = {r: "({} & {})".format(_range("abs(eta)", spec["regions"][r]), pt) for r in REGION}
+    signal = " & ".join("({} > {})".format(var, _num(low)) for var, low in spec["signal"].items())
+
+    terms = ["where({}, {}, 0)".format(region[r], REGION[r]) for r in REGION]
+    terms.append("where({}, {}, 0)".format(signal, SIGNAL))
+    for var in ID_VARS:
+        # the EE thresholds are used outside EB too, the region bits decide anyway
+        eb, ee = (_num(cuts[r].get(var, 1e300)) for r in ("EB", "EE"))
+        terms.append("where({}, where({var} < {}, {}, 0), where({var} < {}, {}, 0))".format(
+            region["EB"], eb, PASS[var], ee, PASS[var], var=var))
+        terms.append("where({}, where({var} > {}, {}, 0), where({var} > {}, {}, 0))".format(
+            region["EB"], eb, FAIL[var], ee, FAIL[var], var=var))
+    expr = " + ".join(terms)
+    columns = sorted({"pt", "eta", *ID_VARS} | set(spec["signal"]))
+    return {"working_point": working_point, "cuts": cuts, "expr": expr, "columns": columns,
+            "code": compile(expr, "<selection>", "eval")}
+
+
+DEFAULT = compile_selection()
+
+
+def compile_preselection(spec=SPEC):
+    """
+    Expression of the events inside one of the regions (the pt and |eta| cuts only). Every selection of
+    the analysis is inside a region, so it can be applied while loading the events.
+    """
+    pt = "(pt > {})".format(_num(spec["pt_min"]))
+    regions = " | ".join("({})".format(_range("abs(eta)", limits)) for limits in spec["regions"].values())
+    expr = "({}) & {}".format(regions, pt)
+    return {"expr": expr, "columns": ["eta", "pt"], "code": compile(expr, "<preselection>", "eval")}
+
+
+def preselect(df, preselection):
+    """Boolean mask of the events of df passing the preselection."""
+    columns = {col: np.asarray(df[col]) for col in preselection["columns"]}
+    if numexpr is not None:
+        return numexpr.evaluate(preselection["expr"], local_dict=columns)
+    return eval(preselection["code"], {"abs": np.abs}, columns)
+
+
+def cut_bits(df, selection=None):
+    """Evaluates the region, ID and signal region cuts once and packs them into a uint16 bitmask."""
+    selection = selection or DEFAULT
+    columns = {col: np.asarray(df[col]) for col in selection["columns"]}
+    n = len(df)
+    if numexpr is not None:
+        return numexpr.evaluate(selection["expr"], local_dict=columns).astype(np.uint16)
+    bits = np.empty(n, dtype=np.uint16)
+    names = {"where": np.where, "abs": np.abs}
+    for start in range(0, n, BLOCK):
+        block = {col: x[start:start + BLOCK] for col, x in columns.items()}
+        bits[start:start + BLOCK] = eval(selection["code"], names, block)
+    return bits
+
+
+def select(bits, region=None, cuts=(), drop=None, background=False, signal=False):
+    """
+    Mask of the events in region passing the ID cuts on `cuts` ("all" for every ID variable,
+    `drop` removes one of them for the N-1 selections), or failing any of them if background.
+    signal: only events in the signal region
+    """
+    required = REGION[region] if region else 0
+    if cuts == "all":
+        cuts = ID_VARS
+    required |= sum(PASS[var] for var in cuts if var != drop)
+    if signal:
+        required |= SIGNAL
+    mask = (bits & required) == required
+    if background:
+        mask &= (bits & ANY_FAIL) != 0
+    return mask
+
+
+# every event has one of 2**13 bit patterns, so a histogram of the patterns (filled in one pass and
+# additive over chunks) is enough to count the events of any selection
+N_PATTERNS = 1 << 13
+PATTERNS = np.arange(N_PATTERNS, dtype=np.uint16)
+
+
+def pattern_counts(bits):
+    return np.bincount(bits, minlength=N_PATTERNS)
+
+
+def count(patterns, *args, **kwargs):
+    """Number of events in a selection (same arguments as select) from the pattern histogram."""
+    return int(patterns[select(PATTERNS, *args, **kwargs)].sum())
+
+
+def cutflow(patterns):
+    """Number of events after each successive cut, plus the N-1 selections, per region."""
+    counts = {}
+    for region in REGION:
+        counts[(region, "region")] = count(patterns, region)
+        for i, var in enumerate(ID_VARS):
+            counts[(region, var)] = count(patterns, region, ID_VARS[:i + 1])
+            counts[(region, "N-1 " + var)] = count(patterns, region, "all", drop=var)
+        counts[(region, "signal region")] = count(patterns, region, "all", signal=True)
+        counts[(region, "background")] = count(patterns, region, background=True)
+        counts[(region, "background signal region")] = count(patterns, region, background=True,
+                                                             signal=True)
+    return counts
+
+
+def print_cutflow(patterns):
+    """Prints the cut-flow table from the pattern histogram."""
+    counts = cutflow(patterns)
+    print("{:<28}{:>12}{:>9}{:>12}{:>9}".format("cut", "EB", "eff", "EE", "eff"))
+    steps = ["region"] + ID_VARS + ["signal region"]
+    steps += ["N-1 " + var for var in ID_VARS] + ["background", "background signal region"]
+    for step in steps:
+        row = "{:<28}".format(step)
+        for region in REGION:
+            n = counts[(region, step)]
+            total = counts[(region, "region")]
+            row += "{:>12}{:>9.4f}".format(n, n/total if total else 0)
+        print(row)
+
+
+# the subsets of the analysis as selections of the bitmask
+SAMPLES = {}
+for _region in REGION:
+    SAMPLES[_region] = {"region": _region}
+    SAMPLES[_region + "cut"] = {"region": _region, "cuts": "all"}
+    SAMPLES[_region + "bg"] = {"region": _region, "background": True}
+    SAMPLES[_region + "scut"] = {"region": _region, "cuts": "all", "signal": True}
+    SAMPLES[_region + "sbg"] = {"region": _region, "background": True, "signal": True}
+    for _i, _var in enumerate(ID_VARS):
+        # N-1 selections: all the cuts except for the one on the n-th variable
+        SAMPLES["cut{}{}".format(_region, _i + 1)] = {"region": _region, "cuts": "all", "drop": _var}
+
+
+def sample_mask(bits, sample):
+    """Boolean mask of the events of one of the SAMPLES ("EB", "EBcut", "cutEE3", ...)."""
+    return select(bits, **SAMPLES[sample])
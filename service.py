@@ -0,0 +1,259 @@
+import copy
+import http.server
+import json
+import threading
+import time
+import types
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+from histograms import Hist
+from selection import (ID_VARS, REGION, SAMPLES, SPEC, compile_selection, count, cut_bits, pattern_counts,
+                       select)
+from xsection import BG_FACTOR, LUMI, cross_section
+
+# analysis service: the events are loaded once and stay in memory, the answers to cut, count,
+# histogram and cross section queries come from bitmasks, pattern counts and extra masks which are
+# computed once per distinct selection / expression and kept (up to CACHED of each), so a repeated
+# query only costs the lookup. Served on localhost as GET requests with json answers, e.g.
+#   /count?sample=EBcut&where=Q == -1
+#   /acceptance?region=EB&cut=EB.iHpT:0.08
+#   /hist?sample=EE&var=mt&bins=60&range=0,300&where=Q == -1
+#   /sigma?working_point=loose&factor=EB:0.2&lumi=36000
+#   /cuts?region=EB&below=sigmaEtaEta:0.01&above=mt:50&n1=1
+# sample: one of selection.SAMPLES, cut: region.variable:threshold replacing a cut of the working point,
+# where: extra condition on the columns (numexpr syntax, & | ~ for and, or, not), lumi: integrated
+# luminosity of the cross section (xsection.LUMI by default).
+# /cuts counts the events of a region with one-sided or range cuts on single variables, from the sorted
+# index (cutindex.py) if the service has one, with n1 also the counts of the N-1 selections.
+CACHED = 64
+WORKERS = 8
+
+
+class Analysis:
+    """Resident events with the cached masks of the queries."""
+
+    def __init__(self, df, spec=SPEC, working_point=None, index=None):
+        # copied out of the memory-mapped cache, so the queries never wait on the disk
+        self.columns = {col: np.array(df[col]) for col in df.columns}
+        self.df = pd.DataFrame(self.columns, copy=False)
+        self.rows = len(df)
+        self.spec, self.working_point = spec, working_point or spec["working_point"]
+        self.index = index
+        self.lock = threading.Lock()
+        self.cache = {"bits": {}, "where": {}, "patterns": {}}
+
+    def _cached(self, kind, key, make):
+        cache = self.cache[kind]
+        with self.lock:
+            if key in cache:
+                return cache[key]
+        value = make()
+        with self.lock:
+            if len(cache) >= CACHED:
+                cache.pop(next(iter(cache)))
+            cache[key] = value
+        return value
+
+    def _spec(self, working_point=None, cuts=()):
+        # the spec with the thresholds of `cuts` ((region, var, threshold)) replaced
+        spec = copy.deepcopy(self.spec)
+        working_point = working_point or self.working_point
+        for region, var, threshold in cuts:
+            if region not in REGION or var not in ID_VARS:
+                raise ValueError("unknown cut {}.{}, cuts are region.variable with a region of {} and a "
+                                 "variable of {}".format(region, var, ", ".join(REGION), ", ".join(ID_VARS)))
+            spec["working_points"][working_point][region][var] = threshold
+        return spec, working_point
+
+    def bits(self, working_point=None, cuts=()):
+        key = json.dumps([working_point or self.working_point, sorted(cuts)])
+
+        def make():
+            spec, wp = self._spec(working_point, cuts)
+            return cut_bits(self.df, compile_selection(spec, wp))
+        return self._cached("bits", key, make)
+
+    def where(self, expr):
+        """Boolean mask of an expression of the columns, None for no condition."""
+        if not expr:
+            return None
+
+        def make():
+            code = compile(expr, "<where>", "eval")
+            if any(isinstance(c, types.CodeType) for c in code.co_consts):
+                raise ValueError("where cannot define functions")
+            unknown = set(code.co_names) - set(self.columns) - {"abs"}
+            if unknown:
+                raise ValueError("unknown names in where: " + ", ".join(sorted(unknown)))
+            if numexpr is not None:
+                mask = numexpr.evaluate(expr, local_dict=self.columns)
+            else:
+                mask = eval(code, {"__builtins__": {}, "abs": np.abs}, self.columns)
+            mask = np.asarray(mask)
+            if mask.dtype != bool:
+                raise ValueError("where must be a condition (e.g. pt > 30), not a {} value".format(mask.dtype))
+            return np.broadcast_to(mask, (self.rows,))
+        return self._cached("where", expr, make)
+
+    def patterns(self, working_point=None, cuts=(), where=None):
+        key = json.dumps([working_point or self.working_point, sorted(cuts), where])
+
+        def make():
+            bits = self.bits(working_point, cuts)
+            mask = self.where(where)
+            return pattern_counts(bits if mask is None else bits[mask])
+        return self._cached("patterns", key, make)
+
+    def count(self, sample, working_point=None, cuts=(), where=None):
+        return {"events": count(self.patterns(working_point, cuts, where), **SAMPLES[sample])}
+
+    def acceptance(self, region, working_point=None, cuts=(), where=None):
+        patterns = self.patterns(working_point, cuts, where)
+        n, n_cut = count(patterns, region), count(patterns, region, "all")
+        return {"region": n, "cut": n_cut, "acceptance": n_cut/n if n else None}
+
+    def hist(self, sample, var, bins=50, range=None, working_point=None, cuts=(), where=None):
+        if bins <= 0:
+            raise ValueError("bins must be positive")
+        if range is not None and (len(range) != 2 or not range[0] < range[1]):
+            raise ValueError("range must be low,high with low < high")
+        mask = select(self.bits(working_point, cuts), **SAMPLES[sample])
+        extra = self.where(where)
+        if extra is not None:
+            mask = mask & extra
+        h = Hist.of(self.columns[var][mask], bins, range)
+        return {"edges": h.edges.tolist(), "counts": h.counts.tolist()}
+
+    def cuts(self, region, cuts, n1=False):
+        """Events of region passing the cuts {var: (low, high)}, and of the N-1 selections if n1."""
+        n = count(self.patterns(), region)
+        if self.index is not None:
+            passed = self.index.count_all(region, cuts)
+            n1 = self.index.n1(region, cuts) if n1 else None
+        else:
+            in_region = select(self.bits(), region)
+            masks = {var: _inside(self.columns[var], *limits) for var, limits in cuts.items()}
+            passed = np.count_nonzero(np.logical_and.reduce([in_region, *masks.values()]))
+            n1 = {var: int(np.count_nonzero(np.logical_and.reduce(
+                [in_region, *(m for other, m in masks.items() if other != var)]))) for var in cuts} if n1 else None
+        out = {"region": n, "events": int(passed), "fraction": passed/n if n else None}
+        if n1 is not None:
+            out["n-1"] = n1
+        return out
+
+    def sigma(self, working_point=None, cuts=(), where=None, factor=None, lumi=LUMI):
+        unknown = set(factor or {}) - set(REGION)
+        if unknown:
+            raise ValueError("unknown regions in factor: " + ", ".join(sorted(unknown)))
+        if not lumi > 0:
+            raise ValueError("lumi must be positive")
+        patterns = self.patterns(working_point, cuts, where)
+        factor = dict(BG_FACTOR, **(factor or {}))
+        n_sig = {r: count(patterns, r, "all", signal=True) for r in REGION}
+        n_bg = {r: count(patterns, r, background=True, signal=True) for r in REGION}
+        return cross_section(n_sig, n_bg, factor, lumi=lumi)
+
+
+def _inside(x, low, high):
+    mask = np.ones(len(x), dtype=bool)
+    if low is not None:
+        mask &= x > low
+    if high is not None:
+        mask &= x < high
+    return mask
+
+
+def _pairs(values):
+    # ["EB.iHpT:0.08", ...] -> [("EB", "iHpT", 0.08), ...]; ["EB:0.2"] -> {"EB": 0.2}
+    out = []
+    for value in values:
+        name, _, number = value.rpartition(":")
+        out.append((*name.split("."), float(number)))
+    return out
+
+
+def query(analysis, path, params):
+    """Answer of the request path (/count, /acceptance, /hist, /sigma) with the query parameters."""
+    first = {k: v[-1] for k, v in params.items()}
+    common = {"working_point": first.get("working_point"), "where": first.get("where")}
+    cuts = tuple(_pairs(params.get("cut", [])))
+    if path == "/count":
+        return analysis.count(first["sample"], cuts=cuts, **common)
+    if path == "/acceptance":
+        return analysis.acceptance(first["region"], cuts=cuts, **common)
+    if path == "/hist":
+        range = tuple(float(x) for x in first["range"].split(",")) if "range" in first else None
+        return analysis.hist(first["sample"], first["var"], int(first.get("bins", 50)), range, cuts=cuts,
+                             **common)
+    if path == "/cuts":
+        cuts = {}
+        for var, low in _pairs(params.get("above", [])):
+            cuts[var] = (low, None)
+        for var, high in _pairs(params.get("below", [])):
+            cuts[var] = (cuts.get(var, (None, None))[0], high)
+        return analysis.cuts(first["region"], cuts, first.get("n1") not in (None, "", "0"))
+    if path == "/sigma":
+        return analysis.sigma(cuts=cuts, factor=dict(_pairs(params.get("factor", []))),
+                              lumi=float(first.get("lumi", LUMI)), **common)
+    raise KeyError("unknown query " + path)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    analysis = None
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        start = time.perf_counter()
+        try:
+            answer = query(self.analysis, url.path, urllib.parse.parse_qs(url.query))
+            answer["ms"] = (time.perf_counter() - start)*1e3
+            status = 200
+        except (KeyError, ValueError, SyntaxError) as error:
+            answer, status = {"error": "{}: {}".format(type(error).__name__, error)}, 400
+        except Exception as error:
+            # any other failure is still answered, the connection is not dropped
+            answer, status = {"error": "{}: {}".format(type(error).__name__, error)}, 500
+        body = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(http.server.HTTPServer):
+    # the requests are handled by a fixed pool of threads (numpy and numexpr release the GIL)
+    def __init__(self, address, handler, workers):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve(analysis, port=8050, workers=WORKERS):
+    """Answers the queries on the resident events on localhost:port until interrupted."""
+    handler = type("Handler", (_Handler,), {"analysis": analysis})
+    with _Server(("127.0.0.1", port), handler, workers) as server:
+        print("serving {} events on http://127.0.0.1:{}/".format(analysis.rows, server.server_address[1]))
+        server.serve_forever()
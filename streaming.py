@@ -0,0 +1,266 @@
+import hashlib
+import io
+import json
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from chunkstore import read_index, scan_store
+from events import DERIVED, add_derived
+from histograms import Hist
+from instrument import stage
+from selection import (DEFAULT, ID_VARS, N_PATTERNS, REGION, SPEC, count, cut_bits, pattern_counts,
+                       print_cutflow, select)
+from xsection import BG_FACTOR, LUMI, cross_section
+
+# streaming mode: the csv is read in chunks of fixed size and every chunk is only added into
+# counters and fixed-binning histograms, so the memory does not depend on the size of the data
+CHUNKSIZE = 500_000
+
+# fixed binning (bins, low, high) of the accumulated distributions
+BINNING = {
+    "pt": (200, 0, 400),
+    "eta": (100, -2.5, 2.5),
+    "MET": (200, 0, 200),
+    "mt": (150, 0, 300),
+    "sigmaEtaEta": (110, 0, 0.055),
+    "HoverE": (100, 0, 0.15),
+    "iTpT": (100, 0, 0.5),
+    "iEpT": (100, 0, 0.5),
+    "iHpT": (100, 0, 0.5),
+}
+KINEMATICS = ["pt", "eta", "MET", "mt"]
+
+
+def new_state():
+    # sources: {path: {"bytes": bytes read, "tail": sha256 of the last TAIL bytes read}}
+    return {"counts": Counter(), "patterns": np.zeros(N_PATTERNS, dtype=np.int64), "hists": {},
+            "runs": Counter(), "sources": {}, "selection": None}
+
+
+def _fill(state, name, values):
+    hists = state["hists"]
+    if name not in hists:
+        bins, low, high = BINNING[name.split("/")[-1]]
+        hists[name] = Hist(np.linspace(low, high, bins + 1))
+    hists[name].fill(values)
+
+
+def accumulate(chunk, state, selection=None):
+    """Adds one chunk of events (with the derived columns) into the counters and histograms."""
+    counts = state["counts"]
+    counts["events"] += len(chunk)
+    state["runs"].update({int(run): int(n) for run, n in chunk.Run.value_counts().items()})
+    bits = cut_bits(chunk, selection)
+    state["patterns"] += pattern_counts(bits)
+    Q = chunk.Q.to_numpy()
+    for region in REGION:
+        in_region = select(bits, region)
+        all_cuts = select(bits, region, "all")
+        background = select(bits, region, background=True)
+        counts[region + "Q+"] += np.count_nonzero(in_region & (Q == 1))
+        counts[region + "Q-"] += np.count_nonzero(in_region & (Q == -1))
+
+        for i, var in enumerate(ID_VARS):
+            values = chunk[var].to_numpy()
+            _fill(state, "{}/{}".format(region, var), values[in_region])
+            # N-1 selection: all the cuts except for the one on var
+            n1 = select(bits, region, "all", drop=var)
+            _fill(state, "cut{}{}/{}".format(region, i + 1, var), values[n1])
+        for var in KINEMATICS:
+            values = chunk[var].to_numpy()
+            _fill(state, "{}/{}".format(region, var), values[in_region])
+            _fill(state, "{}cut/{}".format(region, var), values[all_cuts])
+            _fill(state, "{}bg/{}".format(region, var), values[background])
+    return state
+
+
+def stream(source, chunksize=CHUNKSIZE, state=None, selection=None):
+    """Runs the whole selection over source chunk by chunk, returns the accumulated state."""
+    state = state or new_state()
+    for chunk in _timed(pd.read_csv(source, chunksize=chunksize)):
+        _accumulate(chunk, state, selection)
+    return state
+
+
+def stream_store(path, state=None, selection=None, spec=SPEC, runs=None):
+    """
+    stream over a chunk store (chunkstore.py): the chunks without events in the regions of spec are
+    only added to the event and run counts, those outside the (first, last) runs are left out.
+    """
+    state = state or new_state()
+    index = read_index(path)
+    read = set()
+    for chunk, events in _timed(scan_store(path, spec=spec, runs=runs, index=index), "read chunk",
+                                  lambda c: len(c[1])):
+        read.add(chunk["file"])
+        if not set(DERIVED) <= set(events.columns):
+            add_derived(events)
+        with stage("accumulate", len(events)):
+            accumulate(events, state, selection)
+    for chunk in index["chunks"]:
+        run = chunk["zones"]["Run"][0]
+        if chunk["file"] not in read and (runs is None or runs[0] <= run <= runs[1]):
+            # chunks never span two runs
+            state["counts"]["events"] += chunk["rows"]
+            state["runs"][int(run)] += chunk["rows"]
+    return state
+
+
+def _timed(chunks, name="read csv", size=len):
+    # the reading of every chunk as its own stage of the instrumentation
+    while True:
+        with stage(name) as st:
+            chunk = next(chunks, None)
+            st.events = 0 if chunk is None else size(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _accumulate(chunk, state, selection):
+    with stage("derived", len(chunk)):
+        add_derived(chunk)
+    with stage("accumulate", len(chunk)):
+        accumulate(chunk, state, selection)
+
+
+# incremental mode: the state is saved to disk together with the number of bytes read from every
+# source, a later update only reads the files (or the part of a file) appended since then.
+# The files are assumed to only grow by appending whole lines.
+TAIL = 1 << 16
+
+
+def _tail_sha256(path, end):
+    with open(path, "rb") as f:
+        f.seek(max(0, end - TAIL))
+        return hashlib.sha256(f.read(end - max(0, end - TAIL))).hexdigest()
+
+
+def _selection_key(selection):
+    return hashlib.sha256((selection or DEFAULT)["expr"].encode()).hexdigest()
+
+
+def update(source, state=None, chunksize=CHUNKSIZE, selection=None):
+    """
+    Adds the events of source not yet in state (a new file or the lines appended to a known one).
+    Returns the state and the number of new events.
+    """
+    state = state or new_state()
+    key = _selection_key(selection)
+    if state["selection"] not in (None, key):
+        raise ValueError("the state was accumulated with a different selection")
+    state["selection"] = key
+    path = os.path.abspath(source)
+    size = os.path.getsize(path)
+    done = state["sources"].get(path, {"bytes": 0, "tail": None})
+    if done["bytes"] and (size < done["bytes"] or _tail_sha256(path, done["bytes"]) != done["tail"]):
+        raise ValueError("{} changed since it was processed, the state has to be rebuilt".format(source))
+    events = state["counts"]["events"]
+    if size > done["bytes"]:
+        with open(path, "rb") as f:
+            header = f.readline().decode().strip().split(",")
+            f.seek(max(done["bytes"], f.tell()))
+            text = io.TextIOWrapper(f)
+            for chunk in _timed(pd.read_csv(text, names=header, header=None, chunksize=chunksize)):
+                _accumulate(chunk, state, selection)
+        state["sources"][path] = {"bytes": size, "tail": _tail_sha256(path, size)}
+    return state, state["counts"]["events"] - events
+
+
+def merge(state, other):
+    """Adds the state other (accumulated on other events with the same selection) into state."""
+    if None not in (state["selection"], other["selection"]) and state["selection"] != other["selection"]:
+        raise ValueError("states accumulated with different selections cannot be merged")
+    state["selection"] = state["selection"] or other["selection"]
+    state["counts"].update(other["counts"])
+    state["runs"].update(other["runs"])
+    state["patterns"] += other["patterns"]
+    for name, h in other["hists"].items():
+        if name in state["hists"]:
+            state["hists"][name] += h
+        else:
+            state["hists"][name] = Hist(h.edges, h.counts.copy(), h.sumw2.copy())
+    state["sources"].update(other["sources"])
+    return state
+
+
+def save_state(state, path):
+    """Writes the state into one .npz file (replaced atomically)."""
+    meta = {"counts": {k: int(v) for k, v in state["counts"].items()}, "runs": state["runs"], "sources": state["sources"],
+            "selection": state["selection"], "hists": list(state["hists"])}
+    arrays = {"patterns": state["patterns"]}
+    for i, h in enumerate(state["hists"].values()):
+        arrays["edges{}".format(i)] = h.edges
+        arrays["counts{}".format(i)] = h.counts
+        arrays["sumw2{}".format(i)] = h.sumw2
+    with open(path + ".part", "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(path + ".part", path)
+
+
+def load_state(path):
+    """Reads a state written by save_state, a new state if path does not exist."""
+    if not os.path.exists(path):
+        return new_state()
+    with np.load(path) as f:
+        meta = json.loads(str(f["meta"]))
+        hists = {name: Hist(f["edges{}".format(i)], f["counts{}".format(i)], f["sumw2{}".format(i)])
+                 for i, name in enumerate(meta["hists"])}
+        return {"counts": Counter(meta["counts"]), "patterns": f["patterns"], "hists": hists,
+                "runs": Counter({int(run): n for run, n in meta["runs"].items()}),
+                "sources": meta["sources"], "selection": meta["selection"]}
+
+
+def stream_lookup(state):
+    """lookup of the accumulated histograms for bgfit.fit_factors."""
+    return lambda sample, var: state["hists"]["{}/{}".format(sample, var)]
+
+
+def summary(state, factor=None, lumi=LUMI):
+    """
+    Acceptances, background estimate and cross section from the accumulated state.
+    factor: background normalisation of each region (xsection.BG_FACTOR if None)
+    lumi: integrated luminosity of the events of the state
+    """
+    patterns = state["patterns"]
+    n = {}
+    for region in REGION:
+        n[region] = count(patterns, region)
+        n[region + "cut"] = count(patterns, region, "all")
+        n[region + "bg"] = count(patterns, region, background=True)
+        n[region + "scut"] = count(patterns, region, "all", signal=True)
+        n[region + "sbg"] = count(patterns, region, background=True, signal=True)
+    result = cross_section({r: n[r + "scut"] for r in REGION}, {r: n[r + "sbg"] for r in REGION},
+                           factor or BG_FACTOR, lumi=lumi)
+    result["counts"] = n
+    for region in REGION:
+        result["acceptance " + region] = n[region + "cut"]/n[region]
+        result["background acceptance " + region] = n[region + "bg"]/n[region]
+        result["N-1 acceptances " + region] = [count(patterns, region, "all", drop=var)/n[region]
+                                               for var in ID_VARS]
+    return result
+
+
+def print_summary(state, factor=None, lumi=LUMI):
+    result = summary(state, factor, lumi)
+    n = result["counts"]
+    counts = state["counts"]
+    print("Number of events: " + str(counts["events"]))
+    print_cutflow(state["patterns"])
+    for region in REGION:
+        print(region, "events:", n[region], "after cuts:", n[region + "cut"],
+              "background:", n[region + "bg"])
+        print("Acceptance {}: {:}".format(region, result["acceptance " + region]))
+        print("Background acceptance {}: {:}".format(region, result["background acceptance " + region]))
+        print("N-1 acceptances {}:".format(region), result["N-1 acceptances " + region])
+        print("Signal region {}: {} background: {}".format(region, n[region + "scut"],
+                                                          n[region + "sbg"]))
+        print("Charge {}: +1: {} -1: {}".format(region, counts[region + "Q+"], counts[region + "Q-"]))
+    print("Neb, Nee:", result["N"]["EB"], result["N"]["EE"])
+    print("eps_av:", result["eps_av"])
+    print("Np:", result["Np"])
+    print("cs: ", result["sigma"], "nb +- ", result["sigmaerr"])
+    return result
@@ -0,0 +1,141 @@
+import math
+
+import numpy as np
+
+from selection import ID_VARS, REGION, SPEC, load_spec
+from xsection import BG_FACTOR, cross_section
+
+# systematic variations: every variation scales the electron pt and the MET and shifts the thresholds
+#   {"name": "pt+1%", "group": "pt scale", "pt_scale": 1.01, "met_scale": 1.0,
+#    "scales": {"iHpT": 1.1}, "offsets": {"pt": 1.0, "mt": -5}}
+# scales multiply and offsets shift the ID thresholds of both regions; an offset on "pt" moves the pt
+# threshold of the regions and on a signal region variable its lower limit. All the variations are
+# evaluated together in one pass over the events: pt, MET and the quantities derived from them
+# (iTpT, iEpT, iHpT, mt) are computed for a block of events times all the variations at once, and
+# every cut is a comparison with one threshold per variation.
+BLOCK = 1 << 13
+
+
+def nominal():
+    return {"name": "nominal", "group": None, "pt_scale": 1.0, "met_scale": 1.0, "scales": {}, "offsets": {}}
+
+
+def _variation(name, group, **kwargs):
+    return dict(nominal(), name=name, group=group, **kwargs)
+
+
+def default_variations():
+    """The nominal selection and about fifty shifts of the energy scales and the thresholds."""
+    out = [nominal()]
+    for s in (0.98, 0.99, 0.995, 1.005, 1.01, 1.02):
+        out.append(_variation("pt x{}".format(s), "pt scale", pt_scale=s))
+    for s in (0.9, 0.95, 0.98, 1.02, 1.05, 1.1):
+        out.append(_variation("MET x{}".format(s), "MET scale", met_scale=s))
+    for s in (0.98, 0.99, 1.01, 1.02):
+        out.append(_variation("pt, MET x{}".format(s), "pt and MET scale", pt_scale=s, met_scale=s))
+    for var in ID_VARS:
+        for s in (0.8, 0.9, 0.95, 1.05, 1.1, 1.2):
+            out.append(_variation("{} cut x{}".format(var, s), var + " cut", scales={var: s}))
+    for var, deltas in (("pt", (-1, 1)), ("mt", (-5, 5)), ("MET", (-5, 5))):
+        for d in deltas:
+            out.append(_variation("{} cut {:+}".format(var, d), var + " cut", offsets={var: d}))
+    return out
+
+
+def load_variations(path):
+    """Variations from a json/yaml list (the nominal one is added first if missing)."""
+    variations = [dict(nominal(), **v) for v in load_spec(path)]
+    if not any(v["name"] == "nominal" for v in variations):
+        variations.insert(0, nominal())
+    return variations
+
+
+def _thresholds(variations, spec, cuts):
+    # one array (over the variations) per threshold
+    def shifted(var, value):
+        return np.array([value*v["scales"].get(var, 1.0) + v["offsets"].get(var, 0.0) for v in variations])
+    ids = {r: {var: shifted(var, cuts[r].get(var, 1e300)) for var in ID_VARS} for r in REGION}
+    signal = {var: shifted(var, low) for var, low in spec["signal"].items()}
+    return {"pt_min": shifted("pt", spec["pt_min"]), "ids": ids, "signal": signal}
+
+
+def _inside(x, low, high):
+    mask = np.ones(x.shape, dtype=bool)
+    if low is not None:
+        mask &= x > low
+    if high is not None:
+        mask &= x < high
+    return mask
+
+
+def _count_block(cols, a, b, t, spec, counts):
+    # cols: columns of a block of events; a, b: pt and MET scales; t: thresholds; adds into counts
+    pt = cols["pt"][:, None]*a
+    met = cols["MET"][:, None]*b
+    # same operations as events.add_derived, so a variation is identical to a run on scaled events
+    values = {"pt": pt, "MET": met, "sigmaEtaEta": cols["sigmaEtaEta"][:, None], "HoverE": cols["HoverE"][:, None],
+              "iTpT": cols["isoTrack"][:, None]/pt, "iEpT": cols["isoEcal"][:, None]/pt,
+              "iHpT": cols["isoHcal"][:, None]/pt,
+              "mt": np.sqrt(2*pt*met*(1 - np.cos(cols["phi"] - cols["phiMET"]))[:, None])}
+    abs_eta = np.abs(cols["eta"])[:, None]
+    eta = {r: _inside(abs_eta, *spec["regions"][r]) for r in REGION}
+    above_pt = pt > t["pt_min"]
+    signal = np.logical_and.reduce([values[var] > low for var, low in t["signal"].items()])
+    passed = np.ones(pt.shape, dtype=bool)
+    failed = np.zeros(pt.shape, dtype=bool)
+    for var in ID_VARS:
+        # the EE thresholds are used outside EB, as in selection.compile_selection
+        threshold = np.where(eta["EB"] & above_pt, t["ids"]["EB"][var], t["ids"]["EE"][var])
+        passed &= values[var] < threshold
+        failed |= values[var] > threshold
+    for r in REGION:
+        region = eta[r] & above_pt
+        counts[r]["region"] += np.count_nonzero(region, axis=0)
+        counts[r]["cut"] += np.count_nonzero(region & passed, axis=0)
+        counts[r]["scut"] += np.count_nonzero(region & passed & signal, axis=0)
+        counts[r]["sbg"] += np.count_nonzero(region & failed & signal, axis=0)
+
+
+def vary(events, variations, spec=SPEC, working_point=None, factor=BG_FACTOR, block=BLOCK):
+    """
+    Cross section of every variation (list of dicts, see above) from one pass over the events.
+    Returns a list of the cross_section results with the name, group and counts of each variation.
+    """
+    cuts = spec["working_points"][working_point or spec["working_point"]]
+    t = _thresholds(variations, spec, cuts)
+    a = np.array([v["pt_scale"] for v in variations])
+    b = np.array([v["met_scale"] for v in variations])
+    counts = {r: {k: np.zeros(len(variations), dtype=np.int64) for k in ("region", "cut", "scut", "sbg")}
+              for r in REGION}
+    names = ["pt", "eta", "phi", "MET", "phiMET", "sigmaEtaEta", "HoverE", "isoTrack", "isoEcal", "isoHcal"]
+    columns = {col: np.asarray(events[col]) for col in names}
+    for start in range(0, len(events), block):
+        _count_block({col: x[start:start + block] for col, x in columns.items()}, a, b, t, spec, counts)
+    results = []
+    for i, v in enumerate(variations):
+        n = {r + k: int(counts[r][k][i]) for r in REGION for k in counts[r]}
+        result = cross_section({r: n[r + "scut"] for r in REGION}, {r: n[r + "sbg"] for r in REGION}, factor)
+        result.update(name=v["name"], group=v["group"], counts=n)
+        results.append(result)
+    return results
+
+
+def print_variations(results):
+    """Table of the cross section of every variation, and the shifts from the nominal one."""
+    nominal_sigma = next(r["sigma"] for r in results if r["name"] == "nominal")
+    print("{:<26}{:>8}{:>8}{:>8}{:>8}{:>11}{:>11}".format(
+        "variation", "scut EB", "scut EE", "sbg EB", "sbg EE", "cs [nb]", "shift"))
+    for r in results:
+        n = r["counts"]
+        print("{:<26}{:>8}{:>8}{:>8}{:>8}{:>11.4f}{:>+11.4f}".format(
+            r["name"], n["EBscut"], n["EEscut"], n["EBsbg"], n["EEsbg"], r["sigma"], r["sigma"] - nominal_sigma))
+    # every group (e.g. the pt scale shifts) counts with its largest shift, the groups in quadrature
+    groups = {}
+    for r in results:
+        if r["name"] != "nominal":
+            shift = abs(r["sigma"] - nominal_sigma)
+            key = r["group"] or r["name"]
+            groups[key] = max(groups.get(key, 0.0), shift)
+    total = math.sqrt(sum(s*s for s in groups.values()))
+    print("Systematic uncertainty (largest shift of each group, in quadrature): {:.4f} nb".format(total))
+    return total
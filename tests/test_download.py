@@ -0,0 +1,87 @@
+import functools
+import http.server
+import json
+import os
+import sys
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from download import RangeHandler, download_all, open_download  # noqa: E402
+
+# the downloader against the local stand-in of the open data server, with small segments so that a
+# file of a few hundred kB is fetched in many range requests
+SEGMENT = 16 << 10
+
+
+class _Handler(RangeHandler):
+    # records the Range header of every request
+    ranges = None
+
+    def send_head(self):
+        self.ranges.append(self.headers.get("Range"))
+        return super().send_head()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / "srv"
+    root.mkdir()
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({"Run": np.repeat([146428, 146430], 2000), "pt": rng.exponential(30, 4000),
+                       "eta": rng.uniform(-2.5, 2.5, 4000), "Q": rng.choice([-1, 1], 4000)})
+    df.to_csv(root / "events.csv", index=False)
+    ranges = _Handler.ranges = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_Handler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/events.csv".format(httpd.server_address[1]), root / "events.csv", ranges
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_resume(server, tmp_path):
+    url, source, ranges = server
+    data = source.read_bytes()
+    path = str(tmp_path / "out" / "events.csv")
+    os.makedirs(os.path.dirname(path))
+    # an interrupted download: the first segment is on disk and recorded as done
+    with open(path + ".part", "wb") as f:
+        f.write(data[:SEGMENT])
+        f.truncate(len(data))
+    with open(path + ".part.json", "w") as f:
+        json.dump({"size": len(data), "etag": None, "segment": SEGMENT, "done": {"0": SEGMENT}}, f)
+    download_all({url: path}, {url: "adler32:{:08x}".format(zlib.adler32(data))}, segment=SEGMENT)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert not os.path.exists(path + ".part") and not os.path.exists(path + ".part.json")
+    # only the missing segments were requested (after the probe of the size)
+    assert "bytes=0-{}".format(SEGMENT - 1) not in ranges
+    assert len(ranges) == 1 + (len(data) - 1)//SEGMENT
+
+
+def test_wrong_checksum(server, tmp_path):
+    url, source, _ = server
+    path = str(tmp_path / "out" / "events.csv")
+    with pytest.raises(ValueError, match="adler32"):
+        download_all({url: path}, {url: "adler32:00000000"}, segment=SEGMENT)
+    for name in (path, path + ".part", path + ".part.json"):
+        assert not os.path.exists(name)
+
+
+def test_open_download(server, tmp_path):
+    url, source, _ = server
+    path = str(tmp_path / "out" / "events.csv")
+    with open_download(url, path, segment=SEGMENT) as f:
+        df = pd.read_csv(f)
+    pd.testing.assert_frame_equal(df, pd.read_csv(source))
+    with open(path, "rb") as f:
+        assert f.read() == source.read_bytes()
@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from xsection import (ACCEPTANCE, ACCEPTANCE_REL_ERR, BG_FACTOR, BG_FACTOR_REL_ERR, EFF, EFF_REL_ERR,
+                      LUMI, produced)
+
+# pseudo-experiments for the uncertainty of the cross section: the signal and background counts, the
+# background factors and the efficiencies are resampled for thousands of toys at once (one numpy
+# operation per quantity), the toys are split into fixed batches with their own random streams so
+# the result does not depend on the number of worker processes
+BATCH = 2000
+PERCENTILES = [2.5, 16, 50, 84, 97.5]
+
+
+def _batch(seed, ntoys, n_sig, n_bg, factor, factor_err, mode, total, lumi):
+    rng = np.random.default_rng(seed)
+    regions = ("EB", "EE")
+    if mode == "poisson":
+        sig = {r: rng.poisson(n_sig[r], ntoys) for r in regions}
+        bg = {r: rng.poisson(n_bg[r], ntoys) for r in regions}
+    elif mode == "bootstrap":
+        # resampling the events of the four categories (plus the rest) with replacement
+        counts = [n_sig["EB"], n_bg["EB"], n_sig["EE"], n_bg["EE"]]
+        p = np.array(counts + [total - sum(counts)])/total
+        resampled = rng.multinomial(total, p, ntoys)
+        sig = {"EB": resampled[:, 0], "EE": resampled[:, 2]}
+        bg = {"EB": resampled[:, 1], "EE": resampled[:, 3]}
+    else:
+        raise ValueError("unknown toy mode " + mode)
+    f = {r: rng.normal(factor[r], factor_err[r], ntoys) for r in regions}
+    eff = {r: rng.normal(EFF[r], EFF[r]*EFF_REL_ERR[r], ntoys) for r in regions}
+    acceptance = rng.normal(ACCEPTANCE, ACCEPTANCE*ACCEPTANCE_REL_ERR, ntoys)
+    n = {r: sig[r] - np.ceil(bg[r]*f[r]) for r in regions}
+    return produced(n, eff, acceptance)/lumi
+
+
+def run_toys(n_sig, n_bg, ntoys=10000, factor=BG_FACTOR, factor_err=None, mode="poisson", seed=0,
+             workers=1, total=None, lumi=LUMI):
+    """
+    Cross sections of ntoys pseudo-experiments.
+    n_sig, n_bg: signal region events passing/failing the ID cuts per region
+    factor_err: uncertainty of the background factors (BG_FACTOR_REL_ERR of them if None)
+    mode: "poisson" counts or "bootstrap" resampling of the events
+    total: number of events the bootstrap resamples (all the events)
+    lumi: integrated luminosity of the events
+    """
+    if mode == "bootstrap" and total is None:
+        raise ValueError("the bootstrap needs the total number of events")
+    factor_err = factor_err or {r: f*BG_FACTOR_REL_ERR for r, f in factor.items()}
+    sizes = [min(BATCH, ntoys - start) for start in range(0, ntoys, BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(s, size, n_sig, n_bg, factor, factor_err, mode, total, lumi) for s, size in zip(seeds, sizes)]
+    if workers == 1:
+        return np.concatenate([_batch(*a) for a in args])
+    with ProcessPoolExecutor(workers) as pool:
+        return np.concatenate(list(pool.map(_batch, *zip(*args))))
+
+
+def toy_summary(sigmas):
+    return {"mean": float(np.mean(sigmas)), "std": float(np.std(sigmas, ddof=1)),
+            "percentiles": dict(zip(PERCENTILES, np.percentile(sigmas, PERCENTILES).tolist()))}
+
+
+def print_toys(sigmas):
+    summary = toy_summary(sigmas)
+    print("Toys: {}  cs mean: {:.5f} nb  std: {:.5f} nb".format(len(sigmas), summary["mean"],
+                                                              summary["std"]))
+    print("  percentiles: " + "  ".join("{}%: {:.5f}".format(p, v)
+                                        for p, v in summary["percentiles"].items()))
+    return summary
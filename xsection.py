@@ -0,0 +1,33 @@
+import math
+
+# efficiencies, acceptance and integrated luminosity according to the CMS article
+EFF = {"EB": 0.798, "EE": 0.67}
+ACCEPTANCE = 0.4933
+LUMI = 36000  # nb^-1
+SIGMA_ERR = 234
+# background normalisations read off the MET/mt overlays of Fig7 and Fig8 (see bgfit.py for the fit)
+BG_FACTORS = {"EB": {"MET": 0.22, "mt": 0.09}, "EE": {"MET": 0.27, "mt": 0.25}}
+# the cross section uses the MET factor in EB and the mt factor in EE
+XSEC_VAR = {"EB": "MET", "EE": "mt"}
+BG_FACTOR = {r: BG_FACTORS[r][XSEC_VAR[r]] for r in XSEC_VAR}
+# relative uncertainties assumed in the pseudo-experiments (toys.py)
+EFF_REL_ERR = {"EB": 0.02, "EE": 0.02}
+ACCEPTANCE_REL_ERR = 0.02
+BG_FACTOR_REL_ERR = 0.1
+
+
+def cross_section(n_sig, n_bg, factor=BG_FACTOR, eff=EFF, acceptance=ACCEPTANCE, lumi=LUMI):
+    """
+    n_sig: events in the signal region passing all the ID cuts, per region ("EB", "EE")
+    n_bg: events in the signal region failing the ID cuts (background), per region
+    """
+    n = {r: n_sig[r] - math.ceil(n_bg[r]*factor[r]) for r in ("EB", "EE")}
+    n_total = n_sig["EB"] + n_sig["EE"]
+    eps_av = (n_sig["EB"]*eff["EB"] + n_sig["EE"]*eff["EE"])/n_total if n_total else float("nan")
+    Np = produced(n, eff, acceptance)
+    return {"N": n, "eps_av": eps_av, "Np": Np, "sigma": Np/lumi, "sigmaerr": SIGMA_ERR/lumi}
+
+
+def produced(n, eff=EFF, acceptance=ACCEPTANCE):
+    """Produced W -> e nu events from the background-subtracted yields n per region (numbers or arrays)."""
+    return n["EB"]/acceptance/eff["EB"] + n["EE"]/acceptance/eff["EE"]